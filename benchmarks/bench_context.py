@@ -0,0 +1,93 @@
+"""Prompt context benchmarks: packing documents and the discussion so far, as entities and cycles grow.
+
+Each case builds the context of the last entity's turn in the last cycle, with full memory
+(every earlier response offered to the packer) and with rolling memory (recent responses plus
+per-entity summaries).
+
+    python -m benchmarks.bench_context --output context.json
+"""
+import argparse
+import os
+
+from benchmarks.common import environment, filler_text, summarize, time_call, write_report
+from utils.constants import RETRIEVAL_K, MEMORY_RECENT_TURNS
+from utils.context_packer import discussion_turns, pack_context
+from utils.memory import DiscussionMemory
+from utils.models import get_context_budget
+from utils.tokens import count_tokens
+
+ENTITY_COUNTS = (2, 4, 8, 16)
+CYCLE_COUNTS = (1, 4, 16)
+QUICK_ENTITY_COUNTS = (2, 8)
+QUICK_CYCLE_COUNTS = (1, 8)
+RESPONSE_WORDS = 120
+MODEL_NAME = "mistral-7b"
+
+def make_cycles(entities, cycles):
+    return [
+        [
+            {"entity": f"Entity {e}", "content": filler_text(RESPONSE_WORDS, c * entities + e), "cycle": c + 1}
+            for e in range(entities)
+        ]
+        for c in range(cycles)
+    ]
+
+def make_chunks(k=RETRIEVAL_K):
+    return [{"filename": f"doc_{i}.pdf", "page": i + 1, "text": filler_text(150, i)} for i in range(k)]
+
+def pack_full(budget, chunks, all_cycles, previous_responses, cycle):
+    turns = discussion_turns(previous_responses, all_cycles, cycle)
+    return pack_context(budget, "Entity 0", chunks=chunks, turns=turns)
+
+def pack_rolling(budget, chunks, memory):
+    return pack_context(
+        budget, "Entity 0", chunks=chunks, turns=list(memory.recent), summaries=memory.summaries(),
+        recent_turns=memory.recent_turns
+    )
+
+def run(quick=False, repeat=20):
+    budget = get_context_budget(MODEL_NAME)
+    chunks = make_chunks()
+    # Load the tokenizer up front, so it isn't counted in the first case
+    count_tokens("warmup")
+    results = []
+    for entities in (QUICK_ENTITY_COUNTS if quick else ENTITY_COUNTS):
+        for cycles in (QUICK_CYCLE_COUNTS if quick else CYCLE_COUNTS):
+            all_cycles = make_cycles(entities, cycles)
+            # The last entity of the last cycle sees the earlier cycles and everyone before it in this one
+            previous_cycles, current_cycle = all_cycles[:-1], all_cycles[-1][:-1]
+            responses = sum(len(cycle) for cycle in previous_cycles) + len(current_cycle)
+
+            memory = DiscussionMemory(MEMORY_RECENT_TURNS)
+            for response in [resp for cycle in previous_cycles for resp in cycle] + current_cycle:
+                memory.add(response)
+
+            case = {"entities": entities, "cycles": cycles, "responses_before": responses, "budget_tokens": budget}
+            for name, pack in (
+                ("full_memory", lambda: pack_full(budget, chunks, previous_cycles, current_cycle, cycles)),
+                ("rolling_memory", lambda: pack_rolling(budget, chunks, memory)),
+            ):
+                # The first call counts tokens of new text, later ones hit the token count cache like later turns do
+                first = time_call(pack, 1)[0]
+                timings = time_call(pack, repeat)
+                pdf_context, previous_context = pack()
+                case[name] = {
+                    "first_ms": first * 1000,
+                    **summarize(timings),
+                    "context_tokens": count_tokens(pdf_context) + count_tokens(previous_context),
+                }
+            results.append(case)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="fewer entity and cycle counts")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"benchmark": "context", "environment": environment(), "results": run(args.quick, args.repeat)}
+    write_report(report, os.path.abspath(args.output) if args.output else None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""End-to-end discussion benchmark against the bundled mock LLM server.
+
+Runs the discussion engine that the UI's conduct_discussion drives, in sequential and
+simultaneous rounds, and reports per-cycle latency and first-token times. The request
+scheduler's limits are lifted, so the numbers measure the app and not the rate limit.
+Entities get a small indexed document each when the embedding model is available.
+
+    python -m benchmarks.bench_discussion --entities 4 --cycles 3 --latency 0.2 --tokens-per-second 50
+"""
+import argparse
+import os
+import time
+
+from benchmarks.common import environment, filler_text, percentile, scratch_dir, write_report
+from benchmarks.mock_llm_server import start_server
+from utils.constants import ROUND_MODES
+
+MODEL_NAMES = ("mistral-7b", "llama-3.2-3b", "gemma-3-4b")
+TOPIC = "Should the engine trust the documents it was given?"
+
+def make_entities(count):
+    return [
+        {"uuid": f"bench-{i}", "title": f"Entity {i + 1}", "model": MODEL_NAMES[i % len(MODEL_NAMES)], "sources": []}
+        for i in range(count)
+    ]
+
+def make_materials(entities):
+    """One indexed document per entity, or none without the embedding model; returns (materials, error)"""
+    try:
+        import utils.embedder as embedder
+
+        return {
+            entity["uuid"]: embedder.create_index([{"filename": "notes.pdf", "text": filler_text(2000, i)}])
+            for i, entity in enumerate(entities)
+        }, None
+    except Exception as e:
+        return {}, f"{type(e).__name__}: {e}"
+
+def point_at_server(server):
+    from chat_openrouter import get_api_settings
+    from utils.scheduler import configure_scheduler
+
+    os.environ["API_KEY"] = "benchmark"
+    os.environ["BASE_URL"] = f"{server.base_url}/v1"
+    get_api_settings.cache_clear()
+    configure_scheduler(requests_per_minute=1_000_000, burst=1_000, max_in_flight=1_000)
+
+def run_discussion(entities, entity_materials, cycles, round_mode):
+    from utils.engine import Discussion
+
+    cycle_started = {}
+    cycle_ms = []
+
+    def on_cycle_start(cycle):
+        cycle_started[cycle] = time.perf_counter()
+
+    def on_cycle_end(cycle, responses):
+        cycle_ms.append((time.perf_counter() - cycle_started[cycle]) * 1000)
+
+    start = time.perf_counter()
+    discussion = Discussion(
+        TOPIC, entities, entity_materials, settings={"round_mode": round_mode},
+        on_cycle_start=on_cycle_start, on_cycle_end=on_cycle_end
+    )
+    all_cycles = discussion.run(cycles)
+    total = time.perf_counter() - start
+
+    responses = [resp for cycle in all_cycles for resp in cycle]
+    ttfts = [resp["ttft"] for resp in responses if resp["ttft"] is not None]
+    return {
+        "round_mode": round_mode,
+        "total_ms": total * 1000,
+        "cycle_ms": cycle_ms,
+        "responses": len(responses),
+        "errors": sum(1 for resp in responses if resp["error"]),
+        "ttft_median_ms": percentile(ttfts, 0.5) * 1000 if ttfts else None,
+        "ttft_p95_ms": percentile(ttfts, 0.95) * 1000 if ttfts else None,
+        "prompt_tokens": sum(resp["prompt_tokens"] or 0 for resp in responses),
+    }
+
+def run(entities=4, cycles=3, latency=0.2, tokens=40, tokens_per_second=50, round_modes=ROUND_MODES):
+    server = start_server(latency=latency, tokens=tokens, tokens_per_second=tokens_per_second)
+    try:
+        point_at_server(server)
+        entity_list = make_entities(entities)
+        entity_materials, materials_error = make_materials(entity_list)
+        results = {
+            "server": {"latency_s": latency, "tokens": tokens, "tokens_per_second": tokens_per_second},
+            "entities": entities,
+            "cycles": cycles,
+            "materials": bool(entity_materials),
+            "materials_error": materials_error,
+            # Each mode runs twice: the very first discussion also pays for connections and model clients
+            "runs": [
+                {**run_discussion(entity_list, entity_materials, cycles, round_mode), "run": run_number}
+                for round_mode in round_modes for run_number in (1, 2)
+            ],
+            "requests": server.stats["requests"],
+        }
+        return results
+    finally:
+        server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=4)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock server seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per answer")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="0 streams as fast as possible")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    with scratch_dir():
+        results = run(args.entities, args.cycles, args.latency, args.tokens, args.tokens_per_second)
+    write_report({"benchmark": "discussion", "environment": environment(), "results": results}, output)
+
+if __name__ == "__main__":
+    main()
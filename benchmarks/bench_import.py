@@ -0,0 +1,91 @@
+"""Cold import time of the app's entry points, measured with python -X importtime.
+
+Each target is imported in a fresh interpreter, as a container start or a new Streamlit
+process would. Reports the wall time, the import time of the target itself, the slowest
+modules it pulled in and which of the heavy ML, PDF and HTML stacks got loaded on the way
+(none of them should be until materials are activated).
+
+    python -m benchmarks.bench_import --repeat 5 --output import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import environment, scratch_dir, write_report
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ("streamlit_app", "sidebar", "discuss_cli", "utils.engine", "utils.material_loader")
+HEAVY_MODULES = ("faiss", "numpy", "langchain_huggingface", "sentence_transformers", "torch", "fitz", "bs4")
+SLOWEST = 10
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def import_once(target):
+    code = (
+        f"import json, sys; import {target}; "
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, timeout=300
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return wall, parse_importtime(result.stderr), json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(repeat=3, targets=TARGETS):
+    results = []
+    for target in targets:
+        try:
+            runs = [import_once(target) for _ in range(repeat)]
+        except Exception as e:
+            results.append({"target": target, "error": f"{type(e).__name__}: {e}"})
+            continue
+        # The fastest run has the warmest OS file cache, the median is closer to a cold container
+        walls = [wall for wall, _, _ in runs]
+        _, imports, heavy = runs[walls.index(statistics.median_low(walls))]
+        target_us = next((cumulative for module, _, cumulative in imports if module == target), None)
+        results.append({
+            "target": target,
+            "runs": repeat,
+            "wall_median_ms": statistics.median(walls) * 1000,
+            "wall_min_ms": min(walls) * 1000,
+            "import_ms": target_us / 1000 if target_us is not None else None,
+            "modules": len(imports),
+            "heavy_modules_loaded": heavy,
+            "slowest_self_ms": [
+                {"module": module, "self_ms": self_us / 1000}
+                for module, self_us, _ in sorted(imports, key=lambda item: item[1], reverse=True)[:SLOWEST]
+            ],
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), help="modules to import")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    # Importing the app creates RAG_files in the working directory
+    with scratch_dir():
+        results = run(args.repeat, args.targets)
+    write_report({"benchmark": "import", "environment": environment(), "results": results}, output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""FAISS index type benchmarks: memory, build time, query latency and recall as corpora grow.
+
+Uses synthetic clustered unit vectors of the embedding model's size instead of real embeddings,
+so it runs without the model and scales to large corpora. Recall@k is measured against exact
+search (the flat index). The sweep at the largest size shows the recall / latency tradeoff of
+FAISS_HNSW_EF_SEARCH and FAISS_IVF_NPROBE.
+
+    python -m benchmarks.bench_index --sizes 1000 10000 100000 --output index.json
+"""
+import argparse
+import os
+import time
+
+from benchmarks.common import environment, summarize, time_call, write_report
+from utils.constants import (
+    FLAT_INDEX_TYPE, HNSW_INDEX_TYPE, IVFPQ_INDEX_TYPE, NO_SCALAR_QUANTIZATION, FAISS_IVFPQ_MIN_TRAIN, RETRIEVAL_K
+)
+
+DIM = 384
+SIZES = (1_000, 10_000, 100_000)
+QUICK_SIZES = (1_000, 5_000)
+QUERIES = 200
+# (name, index type, scalar quantization)
+CONFIGS = (
+    ("flat", FLAT_INDEX_TYPE, NO_SCALAR_QUANTIZATION),
+    ("hnsw", HNSW_INDEX_TYPE, NO_SCALAR_QUANTIZATION),
+    ("hnsw_fp16", HNSW_INDEX_TYPE, "fp16"),
+    ("hnsw_int8", HNSW_INDEX_TYPE, "int8"),
+    ("ivfpq", IVFPQ_INDEX_TYPE, NO_SCALAR_QUANTIZATION),
+)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+NPROBE_SWEEP = (1, 4, 16, 64)
+
+def make_vectors(count, seed, centers=None):
+    """Unit vectors around centers, like embeddings of documents on a handful of subjects"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    if centers is None:
+        centers = rng.standard_normal((max(count // 200, 8), DIM)).astype("float32")
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.6 * rng.standard_normal((count, DIM)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, centers
+
+def search_all(index, queries, k):
+    """Query one at a time, as retrieval does; returns (ids, per-query seconds)"""
+    results = []
+
+    def search(query):
+        results.append(index.search(query[None, :], k)[1][0])
+
+    timings = [time_call(search, 1, query)[0] for query in queries]
+    return results, timings
+
+def recall(results, truth):
+    hits = sum(len(set(found[found >= 0]) & set(expected)) for found, expected in zip(results, truth))
+    return hits / sum(len(expected) for expected in truth)
+
+def measure(index, queries, truth, k):
+    import faiss
+
+    results, timings = search_all(index, queries, k)
+    return {
+        "bytes": len(faiss.serialize_index(index)),
+        "bytes_per_vector": len(faiss.serialize_index(index)) / index.ntotal,
+        f"recall_at_{k}": recall(results, truth),
+        "query": summarize(timings),
+    }
+
+def bench_size(size, configs=CONFIGS, k=RETRIEVAL_K, queries=QUERIES):
+    import faiss
+    import numpy as np
+
+    from utils.embedder import build_index, choose_index_type
+
+    vectors, centers = make_vectors(size, seed=size)
+    query_vectors, _ = make_vectors(queries, seed=size + 1, centers=centers)
+    ids = np.arange(size, dtype="int64")
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(vectors)
+    truth = exact.search(query_vectors, k)[1]
+
+    results = {"vectors": size, "auto_index_type": choose_index_type(size, "auto"), "indexes": {}, "_built": {}}
+    for name, index_type, quantization in configs:
+        if index_type == IVFPQ_INDEX_TYPE and size < FAISS_IVFPQ_MIN_TRAIN:
+            results["indexes"][name] = {"skipped": f"IVF-PQ needs at least {FAISS_IVFPQ_MIN_TRAIN} vectors"}
+            continue
+        start = time.perf_counter()
+        index = build_index(index_type, vectors, ids, quantization)
+        build_seconds = time.perf_counter() - start
+        results["indexes"][name] = {"build_ms": build_seconds * 1000, **measure(index, query_vectors, truth, k)}
+        results["_built"][name] = index
+    return results, query_vectors, truth
+
+def sweep(built, query_vectors, truth, k=RETRIEVAL_K):
+    """Recall and latency of the HNSW and IVF-PQ indexes at other search settings"""
+    from utils.embedder import base_index
+
+    results = {}
+    if "hnsw" in built:
+        base = base_index(built["hnsw"])
+        results["hnsw_ef_search"] = []
+        for ef_search in EF_SEARCH_SWEEP:
+            base.hnsw.efSearch = ef_search
+            results["hnsw_ef_search"].append({"ef_search": ef_search, **measure(built["hnsw"], query_vectors, truth, k)})
+    if "ivfpq" in built:
+        base = base_index(built["ivfpq"])
+        results["ivfpq_nprobe"] = []
+        for nprobe in NPROBE_SWEEP:
+            base.nprobe = nprobe
+            results["ivfpq_nprobe"].append({"nprobe": nprobe, **measure(built["ivfpq"], query_vectors, truth, k)})
+    return results
+
+def run(quick=False, sizes=None):
+    sizes = sizes or (QUICK_SIZES if quick else SIZES)
+    results = []
+    for i, size in enumerate(sizes):
+        case, query_vectors, truth = bench_size(size)
+        built = case.pop("_built")
+        if i == len(sizes) - 1:
+            case["sweep"] = sweep(built, query_vectors, truth)
+        results.append(case)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", help="vectors per index")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"benchmark": "index", "environment": environment(), "results": run(args.quick, args.sizes)}
+    write_report(report, os.path.abspath(args.output) if args.output else None)
+
+if __name__ == "__main__":
+    main()
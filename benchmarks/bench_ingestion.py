@@ -0,0 +1,139 @@
+"""Material ingestion benchmarks: PDF text extraction, Wiki loading, and embedding into a FAISS index.
+
+PDFs are generated with PyMuPDF. Wiki pages are the real ones saved in benchmarks/fixtures/wiki
+(python -m benchmarks.bench_wiki_parse --fetch), or generated MediaWiki-like pages when there are
+none, reported as "wiki_pages": "synthetic". They are served by the mock server so
+docloader.load_wiki_content goes through the HTTP cache as it does in the app.
+
+    python -m benchmarks.bench_ingestion --quick --output ingestion.json
+"""
+import argparse
+import glob
+import os
+import time
+
+from benchmarks.common import (
+    FIXTURE_WIKI_PAGES, SYNTHETIC_WIKI_PAGES, environment, filler_text, scratch_dir, summarize, time_call, wiki_fixtures,
+    wiki_pages_folder, write_report
+)
+from benchmarks.mock_llm_server import start_server
+
+PDF_PAGES = (10, 100, 500)
+QUICK_PDF_PAGES = (10, 50)
+WORDS_PER_PAGE = 400
+INDEX_CHUNKS = (50, 500)
+QUICK_INDEX_CHUNKS = (50,)
+
+def make_pdf(path, pages, words_per_page=WORDS_PER_PAGE):
+    import fitz
+
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), filler_text(words_per_page, page_number), fontsize=8)
+    doc.save(path)
+    doc.close()
+
+def bench_pdf(page_counts=PDF_PAGES, repeat=5):
+    from utils.docloader import load_pdf
+
+    results = []
+    for pages in page_counts:
+        path = f"bench_{pages}.pdf"
+        make_pdf(path, pages)
+        chars = len(load_pdf(path))
+        timings = time_call(load_pdf, repeat, path)
+        results.append({
+            "pages": pages,
+            "file_bytes": os.path.getsize(path),
+            "text_chars": chars,
+            "pages_per_second": pages / min(timings),
+            **summarize(timings),
+        })
+    return results
+
+def bench_wiki(repeat=5, quick=False):
+    from utils.docloader import load_wiki_content
+
+    folder, pages = wiki_pages_folder(quick)
+    server = start_server(wiki_folder=folder)
+    try:
+        results = []
+        for path in sorted(glob.glob(os.path.join(folder, "*.html"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            url = f"{server.base_url}/wiki/{name}"
+            # The first load fetches into the HTTP cache, later ones read it back and parse again
+            cold = time_call(load_wiki_content, 1, url)
+            warm = time_call(load_wiki_content, repeat, url)
+            results.append({
+                "page": name,
+                "html_bytes": os.path.getsize(path),
+                "text_chars": len(load_wiki_content(url) or ""),
+                "cold_ms": cold[0] * 1000,
+                "warm": summarize(warm),
+            })
+        return {"pages": pages, "results": results}
+    finally:
+        server.shutdown()
+
+def bench_index(chunk_counts=INDEX_CHUNKS, queries=20):
+    import utils.embedder as embedder
+    from utils.constants import CHUNK_SIZE
+
+    start = time.perf_counter()
+    embedder.warmup()
+    results = {"model_load_ms": (time.perf_counter() - start) * 1000, "indexes": []}
+
+    # Roughly one chunk per CHUNK_SIZE characters of text
+    words_per_chunk = CHUNK_SIZE // 7
+    for chunks in chunk_counts:
+        documents = [
+            {"filename": f"doc_{i}.txt", "text": filler_text(words_per_chunk, i * 7) + f" document {i}"}
+            for i in range(chunks)
+        ]
+        # Cold embeds every passage, warm finds them all in the on-disk embedding cache
+        cold = time_call(embedder.create_index, 1, documents)[0]
+        warm = time_call(embedder.create_index, 1, documents)[0]
+        faiss_index = embedder.create_index(documents)
+        retrieval = time_call(lambda: embedder.retrieve_docs("how does the engine compare arguments", faiss_index, k=8), queries)
+        results["indexes"].append({
+            "documents": chunks,
+            "chunks": len(faiss_index.metadata),
+            "create_cold_ms": cold * 1000,
+            "create_warm_ms": warm * 1000,
+            "chunks_per_second_cold": len(faiss_index.metadata) / cold,
+            "retrieve": summarize(retrieval),
+        })
+    return results
+
+def run(quick=False, repeat=5):
+    """Every ingestion benchmark, each reporting its own error instead of stopping the others"""
+    benches = {
+        "load_pdf": lambda: bench_pdf(QUICK_PDF_PAGES if quick else PDF_PAGES, repeat),
+        "load_wiki_content": lambda: bench_wiki(repeat, quick),
+        "create_index": lambda: bench_index(QUICK_INDEX_CHUNKS if quick else INDEX_CHUNKS),
+    }
+    results = {}
+    for name, bench in benches.items():
+        try:
+            results[name] = bench()
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller inputs")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    with scratch_dir():
+        results = run(args.quick, args.repeat)
+    wiki_pages = FIXTURE_WIKI_PAGES if wiki_fixtures() else SYNTHETIC_WIKI_PAGES
+    report = {"benchmark": "ingestion", "environment": environment(), "wiki_pages": wiki_pages, "results": results}
+    write_report(report, output)
+
+if __name__ == "__main__":
+    main()
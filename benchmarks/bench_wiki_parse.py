@@ -0,0 +1,93 @@
+"""Wiki HTML parsing benchmark.
+
+Compares the original full-page html.parser extraction with the strained parsers used by
+docloader.extract_wiki_text, on saved Wikipedia pages in benchmarks/fixtures/wiki. Without
+saved pages it measures generated MediaWiki-like ones and reports "pages": "synthetic".
+
+    python -m benchmarks.bench_wiki_parse --fetch
+    python -m benchmarks.bench_wiki_parse --fetch https://en.wikipedia.org/wiki/Ada_Lovelace
+    python -m benchmarks.bench_wiki_parse --repeat 20 --output wiki_parse.json
+"""
+import argparse
+import glob
+import os
+from urllib.parse import unquote, urlparse
+
+from bs4 import BeautifulSoup
+
+from benchmarks.common import (
+    WIKI_FIXTURES_FOLDER, WIKI_FIXTURE_URLS, environment, scratch_dir, summarize, time_call, wiki_pages_folder,
+    write_report
+)
+from utils.docloader import WIKI_UNWANTED_SELECTOR, extract_wiki_text
+
+FIXTURES_FOLDER = WIKI_FIXTURES_FOLDER
+
+def legacy_extract(html):
+    """The pre-strainer implementation: whole page through html.parser"""
+    soup = BeautifulSoup(html, 'html.parser')
+    main_content = soup.select_one('#mw-content-text')
+    if main_content is None:
+        body = soup.find('body')
+        return (body or soup).get_text(separator=' ', strip=True)
+    for unwanted in main_content.select(WIKI_UNWANTED_SELECTOR):
+        unwanted.decompose()
+    return main_content.get_text(separator=' ', strip=True)
+
+def parsers():
+    available = {
+        "legacy_html_parser": legacy_extract,
+        "strained_html_parser": lambda html: extract_wiki_text(html, "html.parser"),
+    }
+    try:
+        import lxml  # noqa: F401
+        available["strained_lxml"] = lambda html: extract_wiki_text(html, "lxml")
+    except ImportError:
+        pass
+    return available
+
+def fetch_fixtures(urls=WIKI_FIXTURE_URLS):
+    import requests
+
+    os.makedirs(FIXTURES_FOLDER, exist_ok=True)
+    for url in urls:
+        name = unquote(urlparse(url).path.rstrip("/").split("/")[-1]) or "index"
+        response = requests.get(url, headers={'User-Agent': 'DiscussionBot Wiki Fetcher/1.0'}, timeout=30)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_FOLDER, f"{name}.html"), "w", encoding="utf-8") as f:
+            f.write(response.text)
+        print(f"Saved {name}.html ({len(response.text)} chars)")
+
+def run(repeat, quick=False):
+    """Every parser on every page; synthetic pages are generated in the working directory"""
+    folder, pages = wiki_pages_folder(quick)
+    results = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        page = {"page": os.path.basename(path), "html_bytes": len(html.encode("utf-8")), "parsers": {}}
+        for name, fn in parsers().items():
+            timings = time_call(fn, repeat, html)
+            page["parsers"][name] = {**summarize(timings), "text_chars": len(fn(html))}
+        results.append(page)
+    return {"pages": pages, "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fetch", nargs="*", metavar="URL",
+                        help="save these pages (default: the standard set) as fixtures and exit")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    if args.fetch is not None:
+        fetch_fixtures(args.fetch or WIKI_FIXTURE_URLS)
+        return
+
+    output = os.path.abspath(args.output) if args.output else None
+    with scratch_dir():
+        report = {"benchmark": "wiki_parse", "environment": environment(), "repeat": args.repeat, **run(args.repeat)}
+    write_report(report, output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Helpers shared by the benchmarks"""
+import contextlib
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+WORDS = "the engine compares every argument against the documents it was given".split()
+
+WIKI_FIXTURES_FOLDER = os.path.join(os.path.dirname(__file__), "fixtures", "wiki")
+# Saved by python -m benchmarks.bench_wiki_parse --fetch: a long biography, a long technical
+# article and a short one
+WIKI_FIXTURE_URLS = (
+    "https://en.wikipedia.org/wiki/Alan_Turing",
+    "https://en.wikipedia.org/wiki/Python_(programming_language)",
+    "https://en.wikipedia.org/wiki/Socratic_dialogue",
+)
+FIXTURE_WIKI_PAGES = "fixtures"
+SYNTHETIC_WIKI_PAGES = "synthetic"
+
+def filler_text(words, offset=0):
+    return " ".join(WORDS[(offset + i) % len(WORDS)] for i in range(words))
+
+def wiki_fixtures():
+    return sorted(glob.glob(os.path.join(WIKI_FIXTURES_FOLDER, "*.html")))
+
+def synthetic_wiki_page(paragraphs):
+    """A page shaped like a MediaWiki article, with the navigation and tables the parser has to skip"""
+    body = "".join(
+        f"<h2>Section {i}<span class=\"mw-editsection\">[edit]</span></h2>"
+        f"<p>{filler_text(120, i)}<sup class=\"reference\">[{i}]</sup></p>"
+        f"<table><tr><td>{filler_text(20, i)}</td></tr></table>"
+        for i in range(paragraphs)
+    )
+    navigation = "".join(f"<li><a href=\"/wiki/Link_{i}\">Link {i}</a></li>" for i in range(paragraphs * 5))
+    return (
+        "<html><head><title>Synthetic</title></head><body>"
+        f"<div id=\"mw-navigation\"><ul>{navigation}</ul></div>"
+        f"<div id=\"mw-content-text\">{body}<ol class=\"reflist\"><li>ref</li></ol></div>"
+        f"<div id=\"footer\">{filler_text(200)}</div></body></html>"
+    )
+
+def wiki_pages_folder(quick=False):
+    """(folder, FIXTURE_WIKI_PAGES) for the saved Wikipedia pages, or (folder, SYNTHETIC_WIKI_PAGES)
+    for pages generated in the working directory when none were saved"""
+    if wiki_fixtures():
+        return WIKI_FIXTURES_FOLDER, FIXTURE_WIKI_PAGES
+    folder = os.path.abspath("wiki_pages")
+    os.makedirs(folder, exist_ok=True)
+    for paragraphs in ((20, 200) if quick else (20, 200, 800)):
+        with open(os.path.join(folder, f"Synthetic_{paragraphs}.html"), "w", encoding="utf-8") as f:
+            f.write(synthetic_wiki_page(paragraphs))
+    return folder, SYNTHETIC_WIKI_PAGES
+
+def time_call(fn, repeat, *args):
+    """Seconds taken by each of repeat calls of fn(*args)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def summarize(timings):
+    return {
+        "runs": len(timings),
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+    }
+
+@contextlib.contextmanager
+def scratch_dir():
+    """Run in an empty working directory, so RAG_files and its caches start cold and are thrown away"""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="discuss-bench-") as folder:
+        os.chdir(folder)
+        try:
+            yield folder
+        finally:
+            os.chdir(previous)
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def write_report(report, output=None):
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,191 @@
+"""OpenAI-compatible mock server for benchmarks, with configurable latency and token rate.
+
+POST /v1/chat/completions answers after --latency seconds with --tokens tokens, streamed at
+--tokens-per-second when the request asks for a stream. With --rate-limit N the first N requests
+get a 429, with a Retry-After header when --retry-after is set. GET /wiki/<name> serves
+benchmarks/fixtures/wiki/<name>.html with an ETag and Last-Modified, answering conditional
+requests for unchanged pages with a 304, so Wiki loading can be measured without the network.
+
+    python -m benchmarks.mock_llm_server --port 8765 --latency 0.2 --tokens-per-second 50
+    API_KEY=x BASE_URL=http://127.0.0.1:8765/v1 streamlit run streamlit_app.py
+"""
+import argparse
+import email.utils
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from benchmarks.common import WIKI_FIXTURES_FOLDER, WORDS
+
+FIXTURES_FOLDER = WIKI_FIXTURES_FOLDER
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Token chunks are small writes, don't let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        config = self.server.config
+        if not self.path.startswith("/wiki/"):
+            return self.send_error(404)
+        name = os.path.basename(unquote(self.path[len("/wiki/"):]))
+        path = os.path.join(config["wiki_folder"], f"{name}.html")
+        if not os.path.exists(path):
+            return self.send_error(404)
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        modified = int(os.path.getmtime(path))
+        validators = config["wiki_validators"]
+
+        # If-None-Match wins over If-Modified-Since, as in RFC 9110
+        if "etag" in validators and self.headers.get("If-None-Match"):
+            not_modified = etag in self.headers["If-None-Match"]
+        elif "last_modified" in validators and self.headers.get("If-Modified-Since"):
+            since = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+            not_modified = modified <= since.timestamp()
+        else:
+            not_modified = False
+        with self.server.lock:
+            self.server.stats["wiki_requests"] += 1
+            self.server.stats["not_modified"] += not_modified
+
+        self.send_response(304 if not_modified else 200)
+        if "etag" in validators:
+            self.send_header("ETag", etag)
+        if "last_modified" in validators:
+            self.send_header("Last-Modified", email.utils.formatdate(modified, usegmt=True))
+        if not_modified:
+            return self.end_headers()
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        config = self.server.config
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            stats = self.server.stats
+            stats["requests"] += 1
+            rate_limited = stats["rate_limited"] < config["rate_limit"]
+            if rate_limited:
+                stats["rate_limited"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            if rate_limited:
+                return self.send_rate_limited()
+            time.sleep(config["latency"])
+            self.answer(request)
+        finally:
+            with self.server.lock:
+                self.server.stats["in_flight"] -= 1
+
+    def answer(self, request):
+        config = self.server.config
+        tokens = [WORDS[i % len(WORDS)] + " " for i in range(config["tokens"])]
+        if not request.get("stream"):
+            return self.send_json(completion(request["model"], "".join(tokens)))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = 1 / config["tokens_per_second"] if config["tokens_per_second"] else 0
+        for token in tokens:
+            self.write_chunk("data: " + json.dumps(completion_chunk(request["model"], token)) + "\n\n")
+            if interval:
+                time.sleep(interval)
+        self.write_chunk("data: " + json.dumps(completion_chunk(request["model"], None, "stop")) + "\n\n")
+        self.write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data):
+        body = data.encode("utf-8")
+        self.wfile.write(f"{len(body):x}\r\n".encode("ascii") + body + b"\r\n")
+        self.wfile.flush()
+
+    def send_rate_limited(self):
+        body = json.dumps({"error": {"message": "Rate limit exceeded", "type": "rate_limit", "code": 429}}).encode("utf-8")
+        self.send_response(429)
+        if self.server.config["retry_after"] is not None:
+            self.send_header("Retry-After", self.server.config["retry_after"])
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def completion_chunk(model, content, finish_reason=None):
+    delta = {"content": content} if content is not None else {}
+    return {
+        "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+def completion(model, content):
+    return {
+        "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+def start_server(port=0, latency=0.0, tokens=40, tokens_per_second=0, wiki_folder=FIXTURES_FOLDER,
+                 rate_limit=0, retry_after=None, wiki_validators=("etag", "last_modified")):
+    """Serve in a daemon thread; tokens_per_second 0 streams as fast as possible. Call shutdown() when done.
+
+    The first rate_limit chat requests are answered with a 429 carrying Retry-After: retry_after
+    (any string, so malformed values can be tested too) unless it's None. wiki_validators are the
+    headers wiki pages are sent with and revalidated by.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockLLMHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency": latency, "tokens": tokens, "tokens_per_second": tokens_per_second, "wiki_folder": wiki_folder,
+        "rate_limit": rate_limit, "retry_after": retry_after, "wiki_validators": wiki_validators,
+    }
+    server.stats = {
+        "requests": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0, "wiki_requests": 0, "not_modified": 0
+    }
+    server.lock = threading.Lock()
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per answer")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="0 streams as fast as possible")
+    parser.add_argument("--rate-limit", type=int, default=0, help="answer the first N requests with a 429")
+    parser.add_argument("--retry-after", help="Retry-After header sent with the 429s, in seconds or as an HTTP date")
+    args = parser.parse_args()
+
+    server = start_server(
+        args.port, args.latency, args.tokens, args.tokens_per_second,
+        rate_limit=args.rate_limit, retry_after=args.retry_after
+    )
+    print(f"Serving on {server.base_url}/v1, Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Run every benchmark and write one JSON report, to compare before and after an upgrade.
+
+    python -m benchmarks.run_suite --output bench.json
+    python -m benchmarks.run_suite --quick --only ingestion context
+
+Everything runs in a throwaway working directory, so RAG_files and its caches start cold.
+Wiki loading and parsing are measured on the real pages saved in benchmarks/fixtures/wiki,
+which are fetched first when there are none. When that fails they fall back to generated
+pages, and the report says "wiki_pages": "synthetic".
+"""
+import argparse
+import os
+import sys
+import time
+
+from benchmarks import bench_context, bench_discussion, bench_import, bench_index, bench_ingestion, bench_wiki_parse
+from benchmarks.common import (
+    FIXTURE_WIKI_PAGES, SYNTHETIC_WIKI_PAGES, environment, scratch_dir, wiki_fixtures, write_report
+)
+
+BENCHMARKS = {
+    "import": lambda quick: bench_import.run(1 if quick else 5),
+    "ingestion": lambda quick: bench_ingestion.run(quick),
+    "wiki_parse": lambda quick: bench_wiki_parse.run(3 if quick else 10, quick),
+    "index": lambda quick: bench_index.run(quick),
+    "context": lambda quick: bench_context.run(quick),
+    "discussion": lambda quick: bench_discussion.run(entities=3 if quick else 4, cycles=2 if quick else 3),
+}
+
+def prepare_wiki_pages(fetch=True):
+    """FIXTURE_WIKI_PAGES once real pages are saved, fetching them if need be, else SYNTHETIC_WIKI_PAGES"""
+    if not wiki_fixtures() and fetch:
+        try:
+            bench_wiki_parse.fetch_fixtures()
+        except Exception as e:
+            print(f"Couldn't fetch Wiki fixtures: {type(e).__name__}: {e}", file=sys.stderr)
+    if wiki_fixtures():
+        return FIXTURE_WIKI_PAGES
+    print("No Wiki fixtures, measuring synthetic pages instead", file=sys.stderr)
+    return SYNTHETIC_WIKI_PAGES
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, for a smoke run")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run just these benchmarks")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--no-fetch", action="store_true", help="don't fetch missing Wiki fixtures")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    names = args.only or list(BENCHMARKS)
+    report = {"environment": environment(), "quick": args.quick, "benchmarks": {}}
+    if {"ingestion", "wiki_parse"} & set(names):
+        report["wiki_pages"] = prepare_wiki_pages(not args.no_fetch)
+    with scratch_dir():
+        for name in names:
+            start = time.perf_counter()
+            try:
+                results = BENCHMARKS[name](args.quick)
+            except Exception as e:
+                results = {"error": f"{type(e).__name__}: {e}"}
+            report["benchmarks"][name] = {"seconds": time.perf_counter() - start, "results": results}
+    write_report(report, output)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,32 @@
 import os
+import threading
+from functools import lru_cache
 from typing import Optional
+
+import httpx
 import streamlit as st
 from langchain_openai import ChatOpenAI
 from pydantic import Field, SecretStr
 
+from utils.constants import LLM_MAX_CONNECTIONS, LLM_TIMEOUT
+
+
+def _get_setting(name):
+    value = os.getenv(name)
+    if value is None and hasattr(st, 'secrets'):
+        try:
+            if name in st.secrets:
+                value = st.secrets[name]
+        except FileNotFoundError:
+            # No secrets.toml, as when running headless with settings in the environment
+            pass
+    return value
+
+@lru_cache(maxsize=None)
+def get_api_settings():
+    """API key and base URL, read from the environment or streamlit secrets once per process"""
+    return _get_setting("API_KEY"), _get_setting("BASE_URL")
+
 
 class ChatOpenRouter(ChatOpenAI):
     openai_api_key: Optional[SecretStr] = Field(
@@ -12,24 +35,116 @@ class ChatOpenRouter(ChatOpenAI):
     @property
     def lc_secrets(self) -> dict[str, str]:
         # Try to get from environment variables first, then fall back to streamlit secrets
-        api_key = os.getenv("API_KEY")
-        if api_key is None and hasattr(st, 'secrets') and "API_KEY" in st.secrets:
-            api_key = st.secrets["API_KEY"]
+        api_key, _ = get_api_settings()
         return {"openai_api_key": api_key or ""}
 
     def __init__(self, openai_api_key: Optional[str] = None, **kwargs):
+        api_key, base_url = get_api_settings()
         if openai_api_key is None:
-            openai_api_key = os.getenv("API_KEY")
-            if openai_api_key is None and hasattr(st, 'secrets') and "API_KEY" in st.secrets:
-                openai_api_key = st.secrets["API_KEY"]
-        
-        # Get base URL from environment or secrets
-        base_url = os.getenv("BASE_URL")
-        if base_url is None and hasattr(st, 'secrets') and "BASE_URL" in st.secrets:
-            base_url = st.secrets["BASE_URL"]
-        
+            openai_api_key = api_key
+
         super().__init__(
-            base_url=base_url, 
-            openai_api_key=openai_api_key, 
+            base_url=kwargs.pop("base_url", None) or base_url,
+            openai_api_key=openai_api_key,
             **kwargs
-        )
\ No newline at end of file
+        )
+
+
+# The OpenAI SDK closes a stream as soon as it sees [DONE], before the chunked body's
+# terminator is read, and httpx drops any connection closed mid-body. Draining the
+# few bytes left on close keeps the connection in the pool for the next turn.
+DRAIN_LIMIT = 64 * 1024
+
+class _DrainingStream(httpx.SyncByteStream):
+    def __init__(self, stream):
+        self._stream = stream
+        self._exhausted = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+        self._exhausted = True
+
+    def close(self):
+        try:
+            if not self._exhausted:
+                drained = 0
+                for chunk in self._stream:
+                    drained += len(chunk)
+                    if drained > DRAIN_LIMIT:
+                        break
+        except httpx.HTTPError:
+            pass
+        finally:
+            self._stream.close()
+
+class _AsyncDrainingStream(httpx.AsyncByteStream):
+    def __init__(self, stream):
+        self._stream = stream
+        self._exhausted = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+        self._exhausted = True
+
+    async def aclose(self):
+        try:
+            if not self._exhausted:
+                drained = 0
+                async for chunk in self._stream:
+                    drained += len(chunk)
+                    if drained > DRAIN_LIMIT:
+                        break
+        except httpx.HTTPError:
+            pass
+        finally:
+            await self._stream.aclose()
+
+class _DrainingTransport(httpx.HTTPTransport):
+    def handle_request(self, request):
+        response = super().handle_request(request)
+        response.stream = _DrainingStream(response.stream)
+        return response
+
+class _AsyncDrainingTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        response = await super().handle_async_request(request)
+        response.stream = _AsyncDrainingStream(response.stream)
+        return response
+
+
+# Process-wide registry: one chat model per (model, base URL, params), sharing one
+# keep-alive connection pool per base URL across turns, cycles and sessions.
+_registry_lock = threading.Lock()
+_chat_models = {}
+_http_clients = {}
+
+def _get_http_clients(base_url):
+    clients = _http_clients.get(base_url)
+    if clients is None:
+        limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+        timeout = httpx.Timeout(LLM_TIMEOUT)
+        clients = (
+            httpx.Client(transport=_DrainingTransport(limits=limits), timeout=timeout),
+            httpx.AsyncClient(transport=_AsyncDrainingTransport(limits=limits), timeout=timeout),
+        )
+        _http_clients[base_url] = clients
+    return clients
+
+def get_chat_model(model_name, base_url=None, **params):
+    base_url = base_url or get_api_settings()[1]
+    key = (model_name, base_url, tuple(sorted(params.items())))
+    with _registry_lock:
+        chat_model = _chat_models.get(key)
+        if chat_model is None:
+            http_client, http_async_client = _get_http_clients(base_url)
+            chat_model = ChatOpenRouter(
+                model_name=model_name,
+                base_url=base_url,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                **params
+            )
+            _chat_models[key] = chat_model
+    return chat_model
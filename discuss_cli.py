@@ -0,0 +1,169 @@
+"""Run discussions without the UI, many topics at once, writing NDJSON transcripts.
+
+    python discuss_cli.py --topics topics.txt --cycles 2 --parallel 8 --output transcripts.ndjson
+    python discuss_cli.py --entities entities.json --topics topics.txt --round-mode Simultaneous
+
+--entities is a JSON list of entities in the same shape as the saved RAG_files/<uuid>/entity.json
+(title, model, persona_mode, hedging, sources); without it the entities saved from the UI are
+used. Entities without a uuid get one derived from their title, so their indexes are reused
+from run to run. The topics file has one topic per line; blank lines and lines starting with #
+are skipped.
+
+Every response is written as a {"type": "turn", ...} line with its timings as soon as it's
+done, and every finished discussion as a {"type": "discussion", ...} line, with an "error" instead
+of its counts when it failed. --metrics writes the run's timings and counters at the end, as
+Prometheus text or OpenTelemetry OTLP/JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.constants import (
+    DEFAULT_CYCLES, ROUND_MODES, MEMORY_MODES, MEMORY_RECENT_TURNS, PROMPT_LAYOUTS, RESPONSE_CACHE_MODES,
+    RESPONSE_CACHE_MODE, SEQUENTIAL_ROUND_MODE, FULL_MEMORY_MODE, STANDARD_PROMPT_LAYOUT, METRICS_EXPORT_FORMATS,
+    METRICS_EXPORT
+)
+from utils.engine import Discussion
+from utils.entity_store import load_saved_entities
+from utils.material_loader import load_materials
+from utils.metrics import export_if_enabled
+
+DEFAULT_PARALLEL = 4
+
+def load_entities(path=None):
+    if not path:
+        return load_saved_entities()
+    with open(path, encoding="utf-8") as f:
+        entities = json.load(f)
+    for entity in entities:
+        entity.setdefault("uuid", str(uuid.uuid5(uuid.NAMESPACE_URL, "discuss-entity:" + entity["title"])))
+        for src in entity.get("sources", []):
+            if src["type"] == "pdf":
+                src.setdefault("filename", os.path.basename(src["filepath"]))
+    return entities
+
+def load_topics(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+class TranscriptWriter:
+    """NDJSON lines written whole and flushed, from any number of discussion threads"""
+
+    def __init__(self, out):
+        self.out = out
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.out.write(line)
+            self.out.flush()
+
+def turn_record(topic_index, topic, response):
+    record = {"type": "turn", "topic_index": topic_index, "topic": topic}
+    record.update({key: value for key, value in response.items() if key != "role"})
+    return record
+
+def run_topic(topic_index, topic, entities, entity_materials, settings, num_cycles, writer):
+    start = time.perf_counter()
+    discussion = Discussion(
+        topic, entities, entity_materials, settings=settings,
+        on_response=lambda idx, response: writer.write(turn_record(topic_index, topic, response))
+    )
+    cycles = discussion.run(num_cycles)
+    responses = [resp for cycle in cycles for resp in cycle]
+    errors = sum(1 for resp in responses if resp["error"])
+    writer.write({
+        "type": "discussion",
+        "topic_index": topic_index,
+        "topic": topic,
+        "cycles": len(cycles),
+        "turns": len(responses),
+        "errors": errors,
+        "duration": time.perf_counter() - start,
+    })
+    return errors
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", required=True, help="file with one topic per line")
+    parser.add_argument("--entities", help="JSON list of entity configs (default: the entities saved from the UI)")
+    parser.add_argument("--output", help="NDJSON transcript file (default: stdout)")
+    parser.add_argument("--cycles", type=int, default=DEFAULT_CYCLES)
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL, help="discussions run at once")
+    parser.add_argument("--round-mode", choices=ROUND_MODES, default=SEQUENTIAL_ROUND_MODE)
+    parser.add_argument("--memory", choices=MEMORY_MODES, default=FULL_MEMORY_MODE)
+    parser.add_argument("--recent-turns", type=int, default=MEMORY_RECENT_TURNS,
+                        help="responses kept verbatim with rolling memory")
+    parser.add_argument("--layout", choices=PROMPT_LAYOUTS, default=STANDARD_PROMPT_LAYOUT)
+    parser.add_argument("--response-cache", choices=RESPONSE_CACHE_MODES, default=RESPONSE_CACHE_MODE)
+    parser.add_argument("--metrics", choices=METRICS_EXPORT_FORMATS, default=METRICS_EXPORT)
+    parser.add_argument("--metrics-output", help="metrics file (default: METRICS_EXPORT_PATH or one in RAG_files)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    entities = load_entities(args.entities)
+    if not entities:
+        log("No entities configured")
+        return 2
+    topics = load_topics(args.topics)
+
+    entity_materials, _ = load_materials(
+        entities, {}, {},
+        on_progress=lambda label, done_steps, total_steps: log(f"{label} ({done_steps}/{total_steps})"),
+        on_error=log
+    )
+
+    settings = {
+        "round_mode": args.round_mode,
+        "memory_mode": args.memory,
+        "memory_recent_turns": args.recent_turns,
+        "prompt_layout": args.layout,
+        "response_cache_mode": args.response_cache,
+    }
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    writer = TranscriptWriter(out)
+    start = time.perf_counter()
+    try:
+        # Each discussion has its own thread and runtimes; LLM calls share the scheduler's limits
+        with ThreadPoolExecutor(max_workers=max(args.parallel, 1)) as executor:
+            futures = [
+                executor.submit(run_topic, idx, topic, entities, entity_materials, settings, args.cycles, writer)
+                for idx, topic in enumerate(topics)
+            ]
+            errors = failed = 0
+            for idx, future in enumerate(futures):
+                try:
+                    errors += future.result()
+                except Exception as e:
+                    # One broken discussion shouldn't cost the rest of the batch
+                    failed += 1
+                    log(f"Discussion {idx} failed: {e}")
+                    writer.write({
+                        "type": "discussion",
+                        "topic_index": idx,
+                        "topic": topics[idx],
+                        "error": f"{type(e).__name__}: {e}",
+                    })
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    log(f"{len(topics)} discussions, {failed} failed, {errors} failed responses, {time.perf_counter() - start:.1f}s")
+    metrics_path = export_if_enabled(args.metrics, args.metrics_output)
+    if metrics_path:
+        log(f"Metrics written to {metrics_path}")
+    return 1 if errors or failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,10 @@ import uuid
 import os
 
 import streamlit as st
-from utils.models import list_available_models, get_model_family
+from utils.models import list_available_models, get_model_family, get_fallback_model_name
 from utils.constants import DEFAULT_MODEL_NAME, UPLOAD_FOLDER
+from utils.entity_store import save_entity_config
+import utils.blob_store as blob_store
 
 def setup_model_selection():
     """Configure and display model selection UI"""
@@ -21,6 +23,18 @@ def setup_model_selection():
     
     return selected_model_label.split(" (")[0]
 
+def setup_hedging(selected_model):
+    """Configure hedging to a fallback model of the same family"""
+    fallback = get_fallback_model_name(selected_model)
+    return st.checkbox(
+        "Hedge slow responses",
+        value=False,
+        key="create_entity_hedging",
+        disabled=fallback is None,
+        help=f"If {selected_model} is slower than usual to start answering, also ask {fallback} and keep whichever answers first"
+             if fallback else f"No other {get_model_family(selected_model)} model to fall back to"
+    )
+
 def handle_file_uploads():
     """Handle PDF file uploads"""
     return st.file_uploader(
@@ -30,6 +44,24 @@ def handle_file_uploads():
         key="create_entity_file_uploader"
     )
 
+def setup_page_limits(key):
+    """Optional page limits for the uploaded PDFs"""
+    with st.expander("Page limits"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            first_page = st.number_input("First page", min_value=1, value=1, key=f"{key}_first_page")
+        with col2:
+            last_page = st.number_input("Last page", min_value=0, value=0, key=f"{key}_last_page", help="0 reads to the end")
+        with col3:
+            max_pages = st.number_input("Max pages", min_value=0, value=0, key=f"{key}_max_pages", help="0 uses the default limit")
+
+    limits = {}
+    if first_page > 1 or last_page:
+        limits["page_range"] = [int(first_page), int(last_page) or None]
+    if max_pages:
+        limits["max_pages"] = int(max_pages)
+    return limits
+
 def handle_wiki_link():
     """Handle Wikipedia link input and validation"""
     # Initialize clear link state if needed
@@ -77,35 +109,39 @@ def setup_persona_mode(link):
     
     return persona_mode
 
-def process_uploaded_files(uploaded_files, entity_folder):
-    """Process uploaded PDF files"""
+def process_uploaded_files(uploaded_files, entity_uuid, page_limits=None):
+    """Store uploaded PDF files in the shared blob store"""
     sources = []
     if uploaded_files:
         for uploaded_file in uploaded_files:
-            file_path = os.path.join(entity_folder, uploaded_file.name)
+            sha256 = blob_store.store_blob(uploaded_file.getbuffer())
+            blob_store.acquire(entity_uuid, uploaded_file.name, sha256)
             sources.append({
                 "type": "pdf",
-                "filepath": file_path,
+                "filepath": blob_store.blob_path(sha256),
                 "filename": uploaded_file.name,
-                "was_loaded": False
+                "sha256": sha256,
+                "was_loaded": False,
+                **(page_limits or {})
             })
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
     return sources
 
-def save_entity(title, selected_model, sources, persona_mode):
-    """Save entity to session state"""
-    entity_uuid = str(uuid.uuid1())
+def save_entity(title, selected_model, sources, persona_mode, entity_uuid=None, hedging=False):
+    """Save entity to session state and next to its files"""
+    entity_uuid = entity_uuid or str(uuid.uuid1())
     entity_folder = os.path.join(UPLOAD_FOLDER, entity_uuid)
     os.makedirs(entity_folder, exist_ok=True)
     
-    st.session_state.entities.append({
+    entity = {
         "uuid": entity_uuid,
         "title": title,
         "model": selected_model,
         "persona_mode": persona_mode,
+        "hedging": hedging,
         "sources": sources
-    })
+    }
+    st.session_state.entities.append(entity)
+    save_entity_config(entity)
     
     st.session_state.materials_loaded = False
     st.session_state._entities_changed = True
@@ -118,12 +154,14 @@ def create_entity(new_title):
     # Basic entity info
     title = st.text_input("Title", value=new_title, key="create_entity_title")
     selected_model = setup_model_selection()
+    hedging = setup_hedging(selected_model)
     
     # File and wiki tab setup
     tab1, tab2 = st.tabs(["PDF files", "Wikipedia link"])
 
     with tab1:
         uploaded_files = handle_file_uploads()
+        page_limits = setup_page_limits("create_entity")
 
     with tab2:
         link = handle_wiki_link()
@@ -132,11 +170,9 @@ def create_entity(new_title):
     # Submit button and entity creation
     if st.button("Submit", type="primary"):
         entity_uuid = str(uuid.uuid1())
-        entity_folder = os.path.join(UPLOAD_FOLDER, entity_uuid)
-        os.makedirs(entity_folder, exist_ok=True)
         
         # Process sources
-        sources = process_uploaded_files(uploaded_files, entity_folder)
+        sources = process_uploaded_files(uploaded_files, entity_uuid, page_limits)
         
         # Add wiki link if provided
         if link:
@@ -147,5 +183,5 @@ def create_entity(new_title):
             })
         
         # Save entity to session state
-        save_entity(title, selected_model, sources, persona_mode)
+        save_entity(title, selected_model, sources, persona_mode, entity_uuid, hedging)
         st.rerun()
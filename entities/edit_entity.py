@@ -1,8 +1,12 @@
 import streamlit as st
-import os
 
-from utils.models import list_available_models, get_model_family
-from utils.constants import DEFAULT_MODEL_NAME, UPLOAD_FOLDER
+from utils.models import list_available_models, get_model_family, get_fallback_model_name
+from utils.constants import DEFAULT_MODEL_NAME
+from utils.entity_store import get_entity_folder, save_entity_config
+from utils.material_loader import source_key
+from utils.entity_runtime import invalidate_entity_runtime
+from utils.setup import get_entity_runtimes
+import utils.blob_store as blob_store
 
 def setup_model_selection(id, current_entity):
     available_models = list_available_models()
@@ -21,6 +25,17 @@ def setup_model_selection(id, current_entity):
     
     return selected_model_label.split(" (")[0]
 
+def setup_hedging(id, selected_model, current_entity):
+    fallback = get_fallback_model_name(selected_model)
+    return st.checkbox(
+        "Hedge slow responses",
+        value=current_entity.get("hedging", False) if current_entity else False,
+        key=f"edit_entity_hedging_{id}",
+        disabled=fallback is None,
+        help=f"If {selected_model} is slower than usual to start answering, also ask {fallback} and keep whichever answers first"
+             if fallback else f"No other {get_model_family(selected_model)} model to fall back to"
+    )
+
 def show_and_select_sources_to_remove(id, current_entity):
     sources_to_remove = []
     if current_entity and current_entity.get("sources"):
@@ -34,23 +49,41 @@ def show_and_select_sources_to_remove(id, current_entity):
                 sources_to_remove.append(src)
     return sources_to_remove
 
-def handle_file_uploads(id, entity_folder):
+def handle_file_uploads(id):
     uploaded_files = st.file_uploader(
         "Choose files", type=["txt", "pdf"], accept_multiple_files=True, key=f"edit_entity_file_uploader_{id}"
     )
+    page_limits = setup_page_limits(f"edit_entity_{id}")
     sources = []
     if uploaded_files:
         for uploaded_file in uploaded_files:
-            file_path = os.path.join(entity_folder, uploaded_file.name)
             sources.append({
                 "type": "pdf",
-                "filepath": file_path,
                 "filename": uploaded_file.name,
                 "_uploaded_file": uploaded_file,
-                "was_loaded": False
+                "was_loaded": False,
+                **page_limits
             })
     return sources
 
+def setup_page_limits(key):
+    """Optional page limits for the uploaded PDFs"""
+    with st.expander("Page limits"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            first_page = st.number_input("First page", min_value=1, value=1, key=f"{key}_first_page")
+        with col2:
+            last_page = st.number_input("Last page", min_value=0, value=0, key=f"{key}_last_page", help="0 reads to the end")
+        with col3:
+            max_pages = st.number_input("Max pages", min_value=0, value=0, key=f"{key}_max_pages", help="0 uses the default limit")
+
+    limits = {}
+    if first_page > 1 or last_page:
+        limits["page_range"] = [int(first_page), int(last_page) or None]
+    if max_pages:
+        limits["max_pages"] = int(max_pages)
+    return limits
+
 def handle_wiki_link(id, current_entity):
     current_wiki = ""
     if current_entity and current_entity.get("sources"):
@@ -94,14 +127,21 @@ def process_new_sources(new_sources, item):
             item["sources"] = []
         for src in new_sources:
             if "_uploaded_file" in src:
-                os.makedirs(os.path.dirname(src["filepath"]), exist_ok=True)
-                with open(src["filepath"], "wb") as f:
-                    f.write(src["_uploaded_file"].getbuffer())
-                del src["_uploaded_file"]
-            if not any(existing.get("type") == src["type"] and existing.get("filepath") == src["filepath"] for existing in item["sources"]):
+                src["sha256"] = blob_store.store_blob(src.pop("_uploaded_file").getbuffer())
+                src["filepath"] = blob_store.blob_path(src["sha256"])
+                blob_store.acquire(item["uuid"], src["filename"], src["sha256"])
+
+            existing = next((s for s in item["sources"] if s["type"] == "pdf" and s.get("filename") == src["filename"]), None)
+            if existing is None:
                 item["sources"].append(src)
-                if src["type"] == "pdf":
-                    new_pdf_added = True
+                new_pdf_added = True
+            elif any(existing.get(key) != src.get(key) for key in ("sha256", "page_range", "max_pages")):
+                # Same name, different content or limits: the source is re-indexed on next activation
+                existing.update(sha256=src["sha256"], filepath=src["filepath"], was_loaded=False)
+                existing.pop("page_range", None)
+                existing.pop("max_pages", None)
+                existing.update({key: src[key] for key in ("page_range", "max_pages") if key in src})
+                new_pdf_added = True
     return new_pdf_added
 
 def process_wiki_link(link, item):
@@ -134,20 +174,25 @@ def process_wiki_link(link, item):
 
 def remove_sources(sources_to_remove, item):
     if sources_to_remove:
+        faiss_index = st.session_state.get("entity_materials", {}).get(item["uuid"])
+        entity_processed = st.session_state.get("_processed_files", {}).get(item["uuid"], {})
         for src in sources_to_remove:
             if src in item["sources"]:
                 item["sources"].remove(src)
+                entity_processed.pop(source_key(src), None)
+                if faiss_index is not None:
+                    faiss_index.remove_source(source_key(src))
                 if src["type"] == "pdf":
-                    try:
-                        os.remove(src["filepath"])
-                    except Exception:
-                        pass
+                    blob_store.release(item["uuid"], src["filename"])
+        if faiss_index is not None:
+            faiss_index.save(get_entity_folder(item["uuid"]))
 
-def update_entity(id, title, selected_model, sources_to_remove, new_sources, link, persona_mode):
+def update_entity(id, title, selected_model, sources_to_remove, new_sources, link, persona_mode, hedging=False):
     for item in st.session_state.entities:
         if item["uuid"] == id:
             item["title"] = title
             item["model"] = selected_model
+            item["hedging"] = hedging
             
             remove_sources(sources_to_remove, item)
             
@@ -156,6 +201,8 @@ def update_entity(id, title, selected_model, sources_to_remove, new_sources, lin
             wiki_changed = process_wiki_link(link, item)
             
             item["persona_mode"] = persona_mode
+            save_entity_config(item)
+            invalidate_entity_runtime(get_entity_runtimes(), id)
             
             if new_pdf_added or wiki_changed:
                 st.session_state.materials_loaded = False
@@ -172,20 +219,19 @@ def edit_entity(id, old_title):
     
     title = st.text_input("Title", value=old_title, key="edit_entity_title")
     selected_model = setup_model_selection(id, current_entity)
+    hedging = setup_hedging(id, selected_model, current_entity)
     
     sources_to_remove = show_and_select_sources_to_remove(id, current_entity)
     
     tab1, tab2 = st.tabs(["PDF files", "Wikipedia link"])
 
     with tab1:
-        entity_folder = os.path.join(UPLOAD_FOLDER, str(id))
-        os.makedirs(entity_folder, exist_ok=True)
-        new_sources = handle_file_uploads(id, entity_folder)
+        new_sources = handle_file_uploads(id)
 
     with tab2:
         link = handle_wiki_link(id, current_entity)
         persona_mode = setup_persona_mode(id, link, current_entity)
 
     if st.button("Submit", type="primary"):
-        if update_entity(id, title, selected_model, sources_to_remove, new_sources, link, persona_mode):
+        if update_entity(id, title, selected_model, sources_to_remove, new_sources, link, persona_mode, hedging):
             st.rerun()
@@ -2,6 +2,12 @@ import streamlit as st
 
 import os
 
+from utils.embedder import remove_saved_index
+from utils.entity_store import remove_entity_config
+from utils.entity_runtime import invalidate_entity_runtime
+from utils.setup import get_entity_runtimes
+import utils.blob_store as blob_store
+
 UPLOAD_FOLDER = "RAG_files"
 
 @st.dialog("Remove Entity")
@@ -17,16 +23,12 @@ def remove_entity(id):
                 st.write(f"- {src.get('filename', os.path.basename(src['filepath']))}")
 
     if st.button("Submit", type="primary"):
-        # Remove files from disk
-        if entity and entity.get("sources"):
-            for src in entity["sources"]:
-                if src["type"] == "pdf":
-                    try:
-                        os.remove(src["filepath"])
-                    except Exception:
-                        pass
-        # Remove the entity's folder if empty
+        # Drop the entity's references, blobs no other entity uses are deleted
+        blob_store.release_entity(id)
+        # Remove the saved index and config, then the entity's folder if empty
         entity_folder = os.path.join(UPLOAD_FOLDER, str(id))
+        remove_saved_index(entity_folder)
+        remove_entity_config(id)
         try:
             if os.path.isdir(entity_folder) and not os.listdir(entity_folder):
                 os.rmdir(entity_folder)
@@ -34,4 +36,6 @@ def remove_entity(id):
             pass
         # Remove the entity from session state
         st.session_state.entities = [x for x in st.session_state.entities if x["uuid"] != id]
+        st.session_state.get("entity_materials", {}).pop(id, None)
+        invalidate_entity_runtime(get_entity_runtimes(), id)
         st.rerun()
\ No newline at end of file
@@ -4,10 +4,17 @@ from entities.create_entity import create_entity
 from entities.remove_entity import remove_entity
 from entities.edit_entity import edit_entity
 
-from utils.material_loader import load_all_entity_materials
-from utils.constants import DEFAULT_CYCLES
+from utils.material_loader import load_materials
+from utils.entity_runtime import invalidate_entity_runtime
+from utils.setup import get_entity_runtimes
+from utils.constants import (
+    DEFAULT_CYCLES, ROUND_MODES, MEMORY_MODES, ROLLING_MEMORY_MODE, MEMORY_RECENT_TURNS, PROMPT_LAYOUTS,
+    RESPONSE_CACHE_MODES, RESPONSE_CACHE_MODE, METRICS_EXPORT_FORMATS, METRICS_EXPORT, OFF_METRICS_EXPORT
+)
 from utils.models import get_model_family
 from utils.docloader import extract_persona_name_from_wiki_url
+from utils.embedder import get_embedding_stats
+from utils import metrics
 
 @st.fragment
 def render_sidebar():
@@ -28,6 +35,47 @@ def render_global_settings():
         key="discuss_circles",
         help="Number of discuss circles"
     )
+    st.radio(
+        "Round mode",
+        options=ROUND_MODES,
+        key="round_mode",
+        horizontal=True,
+        help="Sequential: entities answer one after another and see this cycle's earlier answers. "
+             "Simultaneous: all entities answer at once, based on previous cycles only."
+    )
+    st.radio(
+        "Discussion memory",
+        options=MEMORY_MODES,
+        key="memory_mode",
+        horizontal=True,
+        help="Full: every earlier response goes into each prompt. "
+             "Rolling: only the latest responses are kept verbatim, older ones are summarized per entity."
+    )
+    if st.session_state.get("memory_mode") == ROLLING_MEMORY_MODE:
+        st.slider(
+            "Recent responses kept verbatim",
+            min_value=1,
+            max_value=20,
+            value=MEMORY_RECENT_TURNS,
+            key="memory_recent_turns"
+        )
+    st.radio(
+        "Prompt layout",
+        options=PROMPT_LAYOUTS,
+        key="prompt_layout",
+        horizontal=True,
+        help="Prefix-stable puts each entity's identity, documents and instructions first and the discussion last, "
+             "so provider and local-server prompt caches can reuse the unchanged start of the prompt."
+    )
+    st.radio(
+        "Response cache",
+        options=RESPONSE_CACHE_MODES,
+        index=RESPONSE_CACHE_MODES.index(RESPONSE_CACHE_MODE) if RESPONSE_CACHE_MODE in RESPONSE_CACHE_MODES else 0,
+        key="response_cache_mode",
+        horizontal=True,
+        help="Replays answers to prompts that were already sent to the same model with the same settings. "
+             "Read-only uses a recorded cache without adding to it."
+    )
 
 def render_entities_section():
     st.header("Entities")
@@ -118,6 +166,41 @@ def render_model_activation_status():
         st.success("All materials loaded and up to date.")
 
     render_source_loading_stats()
+    render_performance()
+
+def load_all_entity_materials():
+    entity_materials = st.session_state.setdefault("entity_materials", {})
+    processed_files = st.session_state.setdefault("_processed_files", {})
+    entities = st.session_state.entities
+
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+
+    def on_progress(label, done_steps, total_steps):
+        status_text.text(f"{label} ({done_steps}/{total_steps})")
+        progress = done_steps / total_steps
+        progress_bar.progress(progress)
+        st.session_state.loading_progress = progress
+
+    try:
+        load_materials(
+            entities, entity_materials, processed_files,
+            on_progress=on_progress,
+            on_error=lambda message: st.error(message, icon="🚨")
+        )
+        for entity in entities:
+            invalidate_entity_runtime(get_entity_runtimes(), entity["uuid"])
+        metrics.export_if_enabled(st.session_state.get("metrics_export", METRICS_EXPORT))
+
+        st.session_state.materials_loaded = True
+        st.session_state._entities_changed = False
+
+        status_text.empty()
+
+        st.rerun()
+    except Exception as e:
+        st.error(f"Error loading materials: {str(e)}", icon="🚨")
+        st.session_state.materials_loaded = False
 
 def render_source_loading_stats():
     entities = st.session_state.entities
@@ -133,3 +216,91 @@ def render_source_loading_stats():
     loaded_links = sum(len([src for src in entity.get("sources", []) if src["type"] == "wiki" and src.get("was_loaded")])
                        for entity in entities)
     st.markdown(f"**Wiki links:** {loaded_links} / {total_links}")
+
+    render_embedding_stats()
+
+def render_embedding_stats():
+    stats = get_embedding_stats()
+    if stats["load_time"] is None:
+        st.caption("Embedding model: not loaded yet")
+        return
+
+    caption = f"Embedding model loaded in {stats['load_time']:.2f}s"
+    if stats["calls"]:
+        caption += f" · {stats['calls']} calls, avg {stats['avg_time'] * 1000:.0f} ms, last {stats['last_time'] * 1000:.0f} ms"
+    looked_up = stats["cache_hits"] + stats["cache_misses"]
+    if looked_up:
+        caption += f" · cache hits {stats['cache_hits']}/{looked_up}"
+    st.caption(caption)
+
+PERFORMANCE_PHASES = [
+    ("PDF parsing", "pdf.parse"),
+    ("Wiki fetch", "wiki.fetch"),
+    ("Wiki parsing", "wiki.parse"),
+    ("Embedding model load", "embed.model_load"),
+    ("Embedding passages", "embed.passages"),
+    ("Embedding queries", "embed.query"),
+    ("FAISS add", "faiss.add"),
+    ("FAISS search", "faiss.search"),
+    ("FAISS rebuild", "faiss.rebuild"),
+    ("Prompt packing", "prompt.pack"),
+    ("LLM responses", "llm.generate"),
+]
+
+def render_performance():
+    st.subheader("Performance")
+    snapshot = metrics.get_metrics().snapshot()
+    counters, values = snapshot["counters"], snapshot["values"]
+
+    rows = []
+    for label, name in PERFORMANCE_PHASES:
+        summary = snapshot["durations"].get(name)
+        if summary:
+            rows.append({
+                "Phase": label,
+                "Count": summary["count"],
+                "Total s": round(summary["sum"], 2),
+                "Avg ms": round(summary["sum"] / summary["count"] * 1000, 1),
+                "Max ms": round(summary["max"] * 1000, 1),
+            })
+    if not rows:
+        st.caption("Nothing measured yet")
+    else:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+    figures = [f"**PDF parsed:** {counters.get('pdf.bytes_parsed', 0) / 1e6:.1f} MB, {counters.get('pdf.pages', 0)} pages"]
+    vectors_per_second = metrics.rate(snapshot, "embed.passages_embedded", "embed.passages")
+    figures.append(
+        f"**Chunks embedded:** {counters.get('embed.passages_embedded', 0)}"
+        + (f" · {vectors_per_second:.0f} vectors/s" if vectors_per_second else "")
+    )
+    figures.append(f"**Prompt tokens:** {counters.get('llm.prompt_tokens', 0)}")
+    if "llm.ttft_seconds" in values:
+        ttft = values["llm.ttft_seconds"]
+        figures.append(f"**TTFT:** avg {ttft['sum'] / ttft['count']:.2f}s, last {ttft['last']:.2f}s")
+    if "llm.tokens_per_second" in values:
+        rate = values["llm.tokens_per_second"]
+        figures.append(f"**Tokens/s:** avg {rate['sum'] / rate['count']:.1f}, last {rate['last']:.1f}")
+    figures.append(
+        f"**Retries:** {counters.get('llm.retries', 0)} (rate limited {counters.get('llm.rate_limited', 0)}, "
+        f"failed {counters.get('llm.failed', 0)})"
+    )
+    st.markdown("  \n".join(figures))
+
+    st.selectbox(
+        "Export metrics",
+        options=METRICS_EXPORT_FORMATS,
+        index=METRICS_EXPORT_FORMATS.index(METRICS_EXPORT) if METRICS_EXPORT in METRICS_EXPORT_FORMATS else 0,
+        key="metrics_export",
+        help="Written to a local file after every activation and discussion: Prometheus text "
+             "(for a textfile collector) or OpenTelemetry OTLP/JSON lines."
+    )
+    export_col, reset_col = st.columns(2)
+    with export_col:
+        if st.button("Export now", use_container_width=True, disabled=st.session_state.metrics_export == OFF_METRICS_EXPORT):
+            path = metrics.export_if_enabled(st.session_state.metrics_export)
+            st.caption(f"Written to {path}")
+    with reset_col:
+        if st.button("Reset", use_container_width=True):
+            metrics.get_metrics().reset()
+            st.rerun(scope="fragment")
@@ -0,0 +1,66 @@
+"""HttpCache against the mock server's wiki pages, which carry ETag / Last-Modified and answer 304s"""
+import os
+
+import pytest
+
+from benchmarks.mock_llm_server import start_server
+from utils.http_cache import HttpCache
+
+PAGE = "<html><body><div id=\"mw-content-text\"><p>Cached article</p></div></body></html>"
+
+@pytest.fixture
+def wiki(tmp_path):
+    servers = []
+
+    def start(**config):
+        folder = tmp_path / "wiki"
+        folder.mkdir(exist_ok=True)
+        (folder / "Article.html").write_text(PAGE, encoding="utf-8")
+        server = start_server(wiki_folder=str(folder), **config)
+        servers.append(server)
+        return server, f"{server.base_url}/wiki/Article", folder / "Article.html"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+@pytest.mark.parametrize("validators", [("etag",), ("last_modified",)])
+def test_unchanged_page_costs_one_304_and_is_served_from_disk(wiki, tmp_path, validators):
+    server, url, _ = wiki(wiki_validators=validators)
+    # ttl=0 revalidates on every get
+    cache = HttpCache(str(tmp_path / "cache"), ttl=0)
+
+    assert cache.get(url) == PAGE
+    assert cache.get(url) == PAGE
+    assert cache.get(url) == PAGE
+    assert server.stats["wiki_requests"] == 3
+    assert server.stats["not_modified"] == 2
+    assert cache.stats == {"fresh": 0, "revalidated": 2, "fetched": 1}
+
+def test_fresh_entry_makes_no_request(wiki, tmp_path):
+    server, url, _ = wiki()
+    cache = HttpCache(str(tmp_path / "cache"), ttl=3600)
+
+    cache.get(url)
+    assert cache.get(url) == PAGE
+    assert server.stats["wiki_requests"] == 1
+    assert cache.stats["fresh"] == 1
+
+def test_changed_page_is_fetched_again(wiki, tmp_path):
+    server, url, page_path = wiki(wiki_validators=("etag",))
+    cache = HttpCache(str(tmp_path / "cache"), ttl=0)
+
+    cache.get(url)
+    page_path.write_text(PAGE.replace("Cached", "Edited"), encoding="utf-8")
+    assert "Edited article" in cache.get(url)
+    assert server.stats["not_modified"] == 0
+    assert cache.stats["fetched"] == 2
+
+def test_cache_survives_a_new_instance(wiki, tmp_path):
+    server, url, _ = wiki()
+    HttpCache(str(tmp_path / "cache"), ttl=0).get(url)
+
+    cache = HttpCache(str(tmp_path / "cache"), ttl=0)
+    assert cache.get(url) == PAGE
+    assert cache.stats["revalidated"] == 1
+    assert len([name for name in os.listdir(tmp_path / "cache") if name.endswith(".body")]) == 1
@@ -0,0 +1,86 @@
+"""RequestScheduler against the mock OpenAI-compatible server answering 429s"""
+import threading
+import time
+
+import openai
+import pytest
+
+from benchmarks.mock_llm_server import start_server
+from utils.scheduler import RequestScheduler
+
+MODEL = "mock-model"
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**config):
+        server = start_server(**config)
+        servers.append(server)
+        client = openai.OpenAI(base_url=f"{server.base_url}/v1", api_key="test", max_retries=0)
+        return server, lambda: client.chat.completions.create(
+            model=MODEL, messages=[{"role": "user", "content": "hello"}]
+        )
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def scheduler(**limits):
+    # No rate limit of its own and no jitter worth waiting for, unless a test asks for them
+    return RequestScheduler(**{"requests_per_minute": 60000, "burst": 100, "backoff_base": 0.01, **limits})
+
+def test_retries_429s_until_answered(serve):
+    server, create = serve(rate_limit=2, retry_after="0")
+    gate = scheduler()
+
+    assert gate.call(MODEL, create).choices[0].message.content
+    assert server.stats["requests"] == 3
+    assert gate.stats[MODEL]["retries"] == 2
+    assert gate.stats[MODEL]["rate_limited"] == 2
+    assert gate.stats[MODEL]["failed"] == 0
+
+def test_gives_up_after_max_retries(serve):
+    server, create = serve(rate_limit=100, retry_after="0")
+    gate = scheduler(max_retries=2)
+
+    with pytest.raises(openai.RateLimitError):
+        gate.call(MODEL, create)
+    assert server.stats["requests"] == 3
+    assert gate.stats[MODEL]["failed"] == 1
+
+def test_waits_as_long_as_retry_after_asks(serve):
+    _, create = serve(rate_limit=1, retry_after="0.5")
+    gate = scheduler()
+
+    start = time.perf_counter()
+    gate.call(MODEL, create)
+    assert time.perf_counter() - start >= 0.5
+
+def test_retry_after_is_capped_by_backoff_max(serve):
+    _, create = serve(rate_limit=1, retry_after="3600")
+    gate = scheduler(backoff_max=0.2)
+
+    start = time.perf_counter()
+    gate.call(MODEL, create)
+    assert time.perf_counter() - start < 5
+
+@pytest.mark.parametrize("value", ["not a date", "Mon, 99 Foo 2024 25:61:00 GMT", ""])
+def test_malformed_retry_after_backs_off_as_usual(serve, value):
+    server, create = serve(rate_limit=1, retry_after=value)
+    gate = scheduler()
+
+    gate.call(MODEL, create)
+    assert server.stats["requests"] == 2
+
+def test_caps_requests_in_flight_per_model(serve):
+    server, create = serve(latency=0.2)
+    gate = scheduler(max_in_flight=2)
+
+    threads = [threading.Thread(target=gate.call, args=(MODEL, create)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.stats["requests"] == 6
+    assert server.stats["max_in_flight"] == 2
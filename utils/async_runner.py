@@ -0,0 +1,18 @@
+import asyncio
+import threading
+
+_loop = None
+_lock = threading.Lock()
+
+def get_loop():
+    """One long-lived event loop per process, so pooled async HTTP clients stay bound to a live loop"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-runner", daemon=True).start()
+    return _loop
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop and return its concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import utils.docloader as docloader
+from utils.constants import BLOB_FOLDER
+
+_lock = threading.Lock()
+_conn = None
+
+def _get_connection():
+    global _conn
+    if _conn is None:
+        os.makedirs(BLOB_FOLDER, exist_ok=True)
+        _conn = sqlite3.connect(
+            os.path.join(BLOB_FOLDER, "refs.sqlite"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs ("
+            "entity_uuid TEXT NOT NULL, filename TEXT NOT NULL, sha256 TEXT NOT NULL, "
+            "PRIMARY KEY (entity_uuid, filename))"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS refs_sha256 ON refs (sha256)")
+    return _conn
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def blob_path(sha256):
+    return os.path.join(BLOB_FOLDER, f"{sha256}.pdf")
+
+def pages_path(sha256, page_range=None, max_pages=None):
+    suffix = ""
+    if page_range:
+        suffix += f".p{page_range[0]}-{page_range[1]}"
+    if max_pages:
+        suffix += f".m{max_pages}"
+    return os.path.join(BLOB_FOLDER, f"{sha256}{suffix}.pages.jsonl")
+
+def store_blob(data):
+    """Store file contents once under their hash and return the hash"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+    if not os.path.exists(path):
+        os.makedirs(BLOB_FOLDER, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return sha256
+
+def acquire(entity_uuid, filename, sha256):
+    """Point an entity's file at a blob, releasing whatever it pointed at before"""
+    with _lock:
+        conn = _get_connection()
+        row = conn.execute(
+            "SELECT sha256 FROM refs WHERE entity_uuid = ? AND filename = ?", (str(entity_uuid), filename)
+        ).fetchone()
+        conn.execute("INSERT OR REPLACE INTO refs VALUES (?, ?, ?)", (str(entity_uuid), filename, sha256))
+        if row and row[0] != sha256:
+            _delete_if_unreferenced(conn, row[0])
+
+def release(entity_uuid, filename):
+    with _lock:
+        conn = _get_connection()
+        row = conn.execute(
+            "SELECT sha256 FROM refs WHERE entity_uuid = ? AND filename = ?", (str(entity_uuid), filename)
+        ).fetchone()
+        if row:
+            conn.execute("DELETE FROM refs WHERE entity_uuid = ? AND filename = ?", (str(entity_uuid), filename))
+            _delete_if_unreferenced(conn, row[0])
+
+def release_entity(entity_uuid):
+    with _lock:
+        conn = _get_connection()
+        rows = conn.execute("SELECT DISTINCT sha256 FROM refs WHERE entity_uuid = ?", (str(entity_uuid),)).fetchall()
+        conn.execute("DELETE FROM refs WHERE entity_uuid = ?", (str(entity_uuid),))
+        for (sha256,) in rows:
+            _delete_if_unreferenced(conn, sha256)
+
+def _delete_if_unreferenced(conn, sha256):
+    if conn.execute("SELECT 1 FROM refs WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone():
+        return
+    page_caches = [os.path.join(BLOB_FOLDER, name) for name in os.listdir(BLOB_FOLDER)
+                   if name.startswith(sha256) and name.endswith(".pages.jsonl")]
+    for path in [blob_path(sha256), *page_caches]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def parse_blob(sha256, page_range=None, max_pages=None, filetype=None):
+    """Parse a blob into its page cache, one JSON line per page; runs in worker processes, so only the hash goes back.
+    Every blob is named <sha256>.pdf, so filetype says what kind of document the upload really was"""
+    path = pages_path(sha256, page_range, max_pages)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for page_number, text in docloader.iter_pdf_pages(blob_path(sha256), page_range, max_pages, filetype):
+                f.write(json.dumps([page_number, text]) + "\n")
+        os.replace(tmp_path, path)
+    return sha256
+
+def iter_pages(sha256, page_range=None, max_pages=None, filetype=None):
+    """Yield (page_number, text) from the page cache, parsing the blob first if needed"""
+    parse_blob(sha256, page_range, max_pages, filetype)
+    with open(pages_path(sha256, page_range, max_pages), encoding="utf-8") as f:
+        for line in f:
+            page_number, text = json.loads(line)
+            yield page_number, text
@@ -0,0 +1,70 @@
+import re
+
+from utils.constants import CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_RESPECT_SENTENCES
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def _sentence_spans(text):
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        yield start, match.start()
+        start = match.end()
+    if start < len(text):
+        yield start, len(text)
+
+def _window_spans(start, end, chunk_size, chunk_overlap):
+    step = max(chunk_size - chunk_overlap, 1)
+    pos = start
+    while pos < end:
+        yield pos, min(pos + chunk_size, end)
+        if pos + chunk_size >= end:
+            break
+        pos += step
+
+def split_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, respect_sentences=CHUNK_RESPECT_SENTENCES):
+    """Split text into (offset, chunk) pairs of at most chunk_size characters"""
+    if not respect_sentences:
+        return [(s, text[s:e]) for s, e in _window_spans(0, len(text), chunk_size, chunk_overlap)
+                if text[s:e].strip()]
+
+    # Sentences longer than a chunk are cut into fixed windows first
+    spans = []
+    for s, e in _sentence_spans(text):
+        if e - s > chunk_size:
+            spans.extend(_window_spans(s, e, chunk_size, chunk_overlap))
+        else:
+            spans.append((s, e))
+
+    chunks = []
+    current = []
+    for span in spans:
+        if current and span[1] - current[0][0] > chunk_size:
+            chunks.append((current[0][0], current[-1][1]))
+            # Carry trailing sentences forward as overlap
+            overlap = []
+            for prev in reversed(current):
+                if current[-1][1] - prev[0] > chunk_overlap or span[1] - prev[0] > chunk_size:
+                    break
+                overlap.insert(0, prev)
+            current = overlap
+        current.append(span)
+    if current:
+        chunks.append((current[0][0], current[-1][1]))
+
+    return [(s, text[s:e]) for s, e in chunks if text[s:e].strip()]
+
+def chunk_document(doc, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, respect_sentences=CHUNK_RESPECT_SENTENCES):
+    """Yield per-chunk metadata for a {"filename", "text"} document or a {"filename", "pages"} one,
+    where pages is any iterable of (page_number, text) and is consumed lazily"""
+    pages = doc.get("pages")
+    if pages is None:
+        pages = [(None, doc["text"])]
+
+    for page_number, page_text in pages:
+        for offset, text in split_text(page_text, chunk_size, chunk_overlap, respect_sentences):
+            yield {
+                "filename": doc["filename"],
+                "page": page_number,
+                "offset": offset,
+                "text": text
+            }
@@ -1,3 +1,5 @@
+import os
+
 UPLOAD_FOLDER = "RAG_files"
 DEFAULT_CYCLES = 1
 DEFAULT_MODEL_NAME = "mistral-7b"
@@ -9,3 +11,136 @@ Use the 'Discuss circles' slider in the sidebar to control how many rounds of di
 Entities are encouraged to be controversial and take strong stances on topics, so expect lively debates!"""
 
 WIKI_LINK = "wikipedia.org"
+
+# Discussion rounds
+SEQUENTIAL_ROUND_MODE = "Sequential"
+SIMULTANEOUS_ROUND_MODE = "Simultaneous"
+ROUND_MODES = [SEQUENTIAL_ROUND_MODE, SIMULTANEOUS_ROUND_MODE]
+MAX_CONCURRENT_RESPONSES = 4
+# Seconds between repaints of responses streamed in simultaneous rounds
+STREAM_REFRESH_INTERVAL = 0.05
+
+# Discussion memory
+FULL_MEMORY_MODE = "Full"
+ROLLING_MEMORY_MODE = "Rolling"
+MEMORY_MODES = [FULL_MEMORY_MODE, ROLLING_MEMORY_MODE]
+# Rolling memory keeps this many latest responses verbatim and summarizes the rest per entity
+MEMORY_RECENT_TURNS = 6
+MEMORY_SUMMARY_MAX_CHARS = 600
+MEMORY_POINT_MAX_CHARS = 200
+# tiktoken encoding used to report prompt sizes and pack prompts
+TOKEN_ENCODING = "cl100k_base"
+
+# LLM response cache, for replaying discussions without calling the API
+OFF_RESPONSE_CACHE = "Off"
+READWRITE_RESPONSE_CACHE = "Read/write"
+READONLY_RESPONSE_CACHE = "Read-only"
+RESPONSE_CACHE_MODES = [OFF_RESPONSE_CACHE, READWRITE_RESPONSE_CACHE, READONLY_RESPONSE_CACHE]
+RESPONSE_CACHE_MODE = os.getenv("RESPONSE_CACHE_MODE", OFF_RESPONSE_CACHE)
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(UPLOAD_FOLDER, "_response_cache.sqlite"))
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Prompt layout
+STANDARD_PROMPT_LAYOUT = "Standard"
+# Static identity, documents and instructions first, so prompts share a prefix across turns
+PREFIX_STABLE_PROMPT_LAYOUT = "Prefix-stable"
+PROMPT_LAYOUTS = [STANDARD_PROMPT_LAYOUT, PREFIX_STABLE_PROMPT_LAYOUT]
+
+# Prompt packing
+# Tokens kept out of a model's context window for the template, topic and answer
+PROMPT_RESERVED_TOKENS = 1024
+# Chunks retrieved per entity for the discussion topic, before packing
+RETRIEVAL_K = 8
+# Shares of the context budget reserved for the persona and for retrieved chunks;
+# whatever the discussion leaves unused goes to further chunks
+PERSONA_BUDGET_SHARE = 0.25
+CHUNKS_BUDGET_SHARE = 0.35
+
+# Passage chunking and embedding
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+CHUNK_RESPECT_SENTENCES = True
+EMBED_BATCH_SIZE = 32
+EMBEDDING_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, "_embedding_cache")
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, "_blobs")
+
+# FAISS index types: exact search for small corpora, approximate and compressed for large ones
+AUTO_INDEX_TYPE = "auto"
+FLAT_INDEX_TYPE = "flat"
+HNSW_INDEX_TYPE = "hnsw"
+IVFPQ_INDEX_TYPE = "ivfpq"
+FAISS_INDEX_TYPES = [AUTO_INDEX_TYPE, FLAT_INDEX_TYPE, HNSW_INDEX_TYPE, IVFPQ_INDEX_TYPE]
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", AUTO_INDEX_TYPE)
+# Chunks per entity from which auto switches to HNSW, and to IVF-PQ
+FAISS_HNSW_MIN_VECTORS = int(os.getenv("FAISS_HNSW_MIN_VECTORS", "20000"))
+FAISS_IVFPQ_MIN_VECTORS = int(os.getenv("FAISS_IVFPQ_MIN_VECTORS", "200000"))
+# Storage of HNSW vectors: "none" (float32), "fp16" (half the memory) or "int8" (a quarter). With its graph
+# links HNSW takes ~1800 bytes per vector over float32 against flat's ~1550, ~1050 over fp16 and ~660 over int8
+NO_SCALAR_QUANTIZATION = "none"
+SCALAR_QUANTIZATIONS = {NO_SCALAR_QUANTIZATION: "", "fp16": "_SQfp16", "int8": "_SQ8"}
+FAISS_SCALAR_QUANTIZATION = os.getenv("FAISS_SCALAR_QUANTIZATION", "fp16")
+# Recall against latency: higher values find more of the true neighbours, more slowly
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 80
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+# Bytes per vector of IVF-PQ codes (48x smaller than float32 at 384 dimensions), rounded down to a divisor
+# of the embedding size. More bytes recall more of the true neighbours but train slower: on one core at 10k
+# vectors, 16 bytes took ~45 s, 32 ~100 s, 48 ~140 s and 96 ~290 s
+FAISS_PQ_BYTES = 32
+# IVF-PQ trains 256 centroids per sub-quantizer and wants ~39 vectors per centroid
+FAISS_IVFPQ_MIN_TRAIN = 10000
+FAISS_TRAIN_SAMPLE = 100000
+
+# Material ingestion
+MAX_PARSE_WORKERS = min(os.cpu_count() or 1, 8)
+MAX_FETCH_WORKERS = 8
+# Upper bound on pages indexed per PDF unless a source sets its own max_pages
+PDF_MAX_PAGES = 2000
+
+# Wiki fetching
+HTTP_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, "_http_cache")
+# Pages fetched within this many seconds are reused without asking the server
+HTTP_CACHE_TTL = 3600
+HTTP_TIMEOUT = (5, 30)
+HTTP_RETRIES = 3
+HTTP_POOL_SIZE = MAX_FETCH_WORKERS
+# "html" parses the article page, "extract" asks the MediaWiki API for plain text
+WIKI_FETCH_MODE = "html"
+
+# LLM clients
+# Connections kept per API base URL, shared by every model behind it
+LLM_MAX_CONNECTIONS = 16
+LLM_TIMEOUT = 120
+
+# LLM request scheduling, sized for OpenRouter's free-tier limits
+LLM_REQUESTS_PER_MINUTE = 20
+LLM_BURST = 4
+LLM_MAX_IN_FLIGHT_PER_MODEL = 4
+LLM_MAX_RETRIES = 5
+# Seconds; retries back off from LLM_BACKOFF_BASE doubling up to LLM_BACKOFF_MAX, with jitter
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 60
+
+# Hedged requests: the fallback model is asked too once the primary's first token is
+# later than this percentile of its recent first-token latencies
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_WINDOW = 50
+HEDGE_MIN_SAMPLES = 5
+# Seconds to wait for a first token until enough latencies have been seen
+HEDGE_DEFAULT_DELAY = 8.0
+HEDGE_MIN_DELAY = 0.5
+
+# Performance metrics
+METRICS_PREFIX = "discuss_"
+# Spans kept for OpenTelemetry export; older ones are dropped
+METRICS_MAX_SPANS = 5000
+OFF_METRICS_EXPORT = "Off"
+PROMETHEUS_METRICS_EXPORT = "Prometheus"
+OTEL_METRICS_EXPORT = "OpenTelemetry"
+METRICS_EXPORT_FORMATS = [OFF_METRICS_EXPORT, PROMETHEUS_METRICS_EXPORT, OTEL_METRICS_EXPORT]
+# Written after every activation and discussion unless Off
+METRICS_EXPORT = os.getenv("METRICS_EXPORT", OFF_METRICS_EXPORT)
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH")
+PROMETHEUS_METRICS_PATH = os.path.join(UPLOAD_FOLDER, "_metrics.prom")
+OTEL_METRICS_PATH = os.path.join(UPLOAD_FOLDER, "_metrics.otlp.jsonl")
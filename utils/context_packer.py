@@ -0,0 +1,114 @@
+from utils.constants import MEMORY_RECENT_TURNS, PERSONA_BUDGET_SHARE, CHUNKS_BUDGET_SHARE
+from utils.tokens import count_tokens_cached, truncate_to_tokens
+
+PERSONA_HEADER = "ABOUT YOU ({persona_name}):\n"
+DOCUMENTS_HEADER = "CONTEXT FROM YOUR DOCUMENTS:\n"
+ADDITIONAL_HEADER = "ADDITIONAL CONTEXT:\n"
+SUMMARY_HEADER = "Summary of the earlier discussion:\n"
+TURNS_HEADER = "Discussion so far:\n"
+OMITTED_TURNS_HEADER = "Discussion so far ({omitted} earlier responses left out):\n"
+
+def discussion_turns(previous_responses=None, all_previous_cycles=None, cycle_num=1):
+    """Every earlier response as {"entity", "content", "cycle"}, oldest first"""
+    turns = []
+    for cycle_idx, cycle in enumerate(all_previous_cycles or []):
+        for resp in cycle:
+            turns.append({"entity": resp["entity"], "content": resp["content"], "cycle": resp.get("cycle", cycle_idx + 1)})
+    for resp in previous_responses or []:
+        turns.append({"entity": resp["entity"], "content": resp["content"], "cycle": cycle_num})
+    return turns
+
+def format_chunk(chunk):
+    page = f", page {chunk['page']}" if chunk.get("page") is not None else ""
+    return f"--- From {chunk['filename']}{page} ---\n{chunk['text']}\n\n"
+
+def format_turn(turn, entity_name):
+    speaker = "YOU said" if turn["entity"] == entity_name else f"{turn['entity']} said"
+    return f"- Cycle {turn['cycle']}, {speaker}: {turn['content']}\n"
+
+def format_summary(entity, summary, entity_name):
+    speaker = "YOU" if entity == entity_name else entity
+    return f"- {speaker}: {summary}\n"
+
+def _take(items, room):
+    """Leading items whose token costs fit in room, stopping at the first that doesn't"""
+    taken = []
+    used = 0
+    for item in items:
+        cost = count_tokens_cached(item)
+        if used + cost > room:
+            break
+        taken.append(item)
+        used += cost
+    return taken, used
+
+def pack_context(budget, entity_name, persona_name=None, persona_text="", chunks=(), turns=(), summaries=None,
+                 recent_turns=MEMORY_RECENT_TURNS, fill_chunks=True):
+    """Pack the prompt's document and discussion context into budget tokens.
+
+    Space goes by priority: the persona (up to PERSONA_BUDGET_SHARE of the budget), retrieved
+    chunks in rank order (up to CHUNKS_BUDGET_SHARE), the last recent_turns responses, the
+    per-entity summaries, older responses newest first, and finally more chunks with whatever
+    is left. Without fill_chunks that last step is skipped, so the document context doesn't
+    depend on the discussion and stays identical from turn to turn. Returns (pdf_context,
+    previous_context).
+    """
+    remaining = budget
+
+    persona_section = ""
+    if persona_name and persona_text:
+        header = PERSONA_HEADER.format(persona_name=persona_name)
+        room = min(remaining, int(budget * PERSONA_BUDGET_SHARE)) - count_tokens_cached(header)
+        text = truncate_to_tokens(persona_text, room)
+        if text:
+            persona_section = header + text + ("..." if len(text) < len(persona_text) else "") + "\n\n"
+            remaining -= count_tokens_cached(persona_section)
+
+    chunk_texts = [format_chunk(chunk) for chunk in chunks]
+    chunks_header = ADDITIONAL_HEADER if persona_section else DOCUMENTS_HEADER
+    if chunk_texts:
+        remaining -= count_tokens_cached(chunks_header)
+    kept_chunks, used = _take(chunk_texts, min(remaining, int(budget * CHUNKS_BUDGET_SHARE)))
+    remaining -= used
+
+    recent = list(turns[-recent_turns:]) if recent_turns else []
+    older = list(turns[:len(turns) - len(recent)])
+
+    if recent:
+        remaining -= count_tokens_cached(OMITTED_TURNS_HEADER if older else TURNS_HEADER)
+    kept_recent, used = _take([format_turn(turn, entity_name) for turn in reversed(recent)], remaining)
+    remaining -= used
+
+    kept_summaries = []
+    if summaries and len(kept_recent) == len(recent):
+        remaining -= count_tokens_cached(SUMMARY_HEADER)
+        kept_summaries, used = _take(
+            [format_summary(entity, summary, entity_name) for entity, summary in summaries.items()], remaining
+        )
+        remaining -= used
+
+    kept_older = []
+    if older and len(kept_recent) == len(recent):
+        kept_older, used = _take([format_turn(turn, entity_name) for turn in reversed(older)], remaining)
+        remaining -= used
+
+    if fill_chunks:
+        # The discussion is short, give the rest to further chunks
+        extra_chunks, used = _take(chunk_texts[len(kept_chunks):], remaining)
+        kept_chunks += extra_chunks
+
+    pdf_context = persona_section
+    if kept_chunks:
+        pdf_context += chunks_header + "".join(kept_chunks)
+
+    previous_context = ""
+    if kept_summaries:
+        previous_context = SUMMARY_HEADER + "".join(kept_summaries)
+    kept_turns = kept_older[::-1] + kept_recent[::-1]
+    if kept_turns:
+        if previous_context:
+            previous_context += "\n"
+        omitted = len(turns) - len(kept_turns)
+        previous_context += (OMITTED_TURNS_HEADER.format(omitted=omitted) if omitted else TURNS_HEADER) + "".join(kept_turns)
+
+    return pdf_context, previous_context
@@ -1,17 +1,57 @@
+import importlib.util
+import json
+import logging
 import os
-import fitz
-import requests
-from bs4 import BeautifulSoup
-import streamlit as st
-from urllib.parse import urlparse, unquote
+import time
+
+from urllib.parse import urlparse, unquote, quote
+
+from utils.constants import WIKI_FETCH_MODE
+from utils.http_cache import get_http_cache
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# fitz (PyMuPDF) and bs4 are imported by the functions that parse, so the app can start without loading them
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Only the article body is built into a tree; navigation, sidebars and footers are skipped by the parser
+WIKI_CONTENT_ID = "mw-content-text"
+WIKI_UNWANTED_SELECTOR = '.mw-editsection, .reference, .reflist, table'
+
+def iter_pdf_pages(file_path, page_range=None, max_pages=None, filetype=None):
+    """Yield (page_number, text) one page at a time; page_range is 1-based and inclusive.
+    filetype ("pdf", "txt", ...) overrides the one PyMuPDF guesses from the file name"""
+    # Only the time spent parsing is measured, not what the caller does between pages
+    import fitz
+
+    parse_time = 0.0
+    pages = chars = 0
+    start = time.perf_counter()
+    try:
+        with fitz.open(file_path, filetype=filetype) as doc:
+            first, last = page_range or (1, None)
+            first = max(first, 1)
+            last = doc.page_count if last is None else min(last, doc.page_count)
+            if max_pages:
+                last = min(last, first + max_pages - 1)
+            parse_time += time.perf_counter() - start
+            for page_number in range(first, last + 1):
+                start = time.perf_counter()
+                text = doc.load_page(page_number - 1).get_text()
+                parse_time += time.perf_counter() - start
+                pages += 1
+                chars += len(text)
+                yield page_number, text
+    finally:
+        metrics.record("pdf.parse", parse_time, file=os.path.basename(file_path), pages=pages)
+        metrics.count("pdf.pages", pages)
+        metrics.count("pdf.chars", chars)
+        if pages and os.path.exists(file_path):
+            metrics.count("pdf.bytes_parsed", os.path.getsize(file_path))
 
 def load_pdf(file_path):
-    doc = fitz.open(file_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    doc.close()
-    return text
+    return "".join(text for _, text in iter_pdf_pages(file_path))
 
 def load_documents_from_folder(folder_path):
     documents = []
@@ -21,29 +61,69 @@ def load_documents_from_folder(folder_path):
             documents.append({"filename": filename, "text": text})
     return documents
 
+def extract_wiki_text(html, parser=HTML_PARSER):
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    soup = BeautifulSoup(html, parser, parse_only=SoupStrainer(id=WIKI_CONTENT_ID))
+    
+    main_content = soup.select_one('#mw-content-text')
+    
+    if main_content:
+        for unwanted in main_content.select(WIKI_UNWANTED_SELECTOR):
+            unwanted.decompose()
+            
+        text = main_content.get_text(separator=' ', strip=True)
+        return text
+
+    # Not a MediaWiki article, fall back to parsing the whole page
+    soup = BeautifulSoup(html, parser)
+    body = soup.find('body')
+    if body:
+        return body.get_text(separator=' ', strip=True)
+    return soup.get_text(separator=' ', strip=True)
+
+def wiki_extract_api_url(url):
+    """MediaWiki API URL returning the article as plain text, or None for non-article URLs"""
+    parsed_url = urlparse(url)
+    path_parts = parsed_url.path.strip('/').split('/')
+    if len(path_parts) < 2 or path_parts[0] != "wiki":
+        return None
+    title = quote(unquote("/".join(path_parts[1:])))
+    return (f"{parsed_url.scheme}://{parsed_url.netloc}/w/api.php?action=query&prop=extracts"
+            f"&explaintext=1&redirects=1&format=json&formatversion=2&titles={title}")
+
+def fetch_wiki_extract(api_url):
+    with metrics.span("wiki.fetch", mode="extract"):
+        body = get_http_cache().get(api_url)
+    metrics.count("wiki.chars_fetched", len(body))
+    data = json.loads(body)
+    pages = data.get("query", {}).get("pages", [])
+    if not pages or pages[0].get("missing"):
+        return None
+    return pages[0].get("extract")
+
+def fetch_wiki_content(url, mode=WIKI_FETCH_MODE):
+    """Article text of a Wiki page; mode "extract" asks the MediaWiki API for plain text and skips HTML parsing"""
+    if mode == "extract":
+        api_url = wiki_extract_api_url(url)
+        if api_url:
+            text = fetch_wiki_extract(api_url)
+            if text:
+                return text
+
+    with metrics.span("wiki.fetch", mode="html"):
+        html = get_http_cache().get(url)
+    metrics.count("wiki.chars_fetched", len(html))
+    with metrics.span("wiki.parse"):
+        text = extract_wiki_text(html)
+    metrics.count("wiki.chars_parsed", len(html))
+    return text
+
 def load_wiki_content(url):
     try:
-        response = requests.get(url, headers={'User-Agent': 'DiscussionBot Wiki Fetcher/1.0'})
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        main_content = soup.select_one('#mw-content-text')
-        
-        if main_content:
-            for unwanted in main_content.select('.mw-editsection, .reference, .reflist, table'):
-                unwanted.decompose()
-                
-            text = main_content.get_text(separator=' ', strip=True)
-            return text
-        else:
-            body = soup.find('body')
-            if body:
-                return body.get_text(separator=' ', strip=True)
-            return soup.get_text(separator=' ', strip=True)
-    
+        return fetch_wiki_content(url)
     except Exception as e:
-        st.error(f"Error fetching wiki content: {str(e)}", icon="🚨")
+        logger.error(f"Error fetching wiki content: {str(e)}")
         return None
 
 def extract_persona_name_from_wiki_url(url):
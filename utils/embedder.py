@@ -1,40 +1,436 @@
-import faiss
-import numpy as np
-from langchain_huggingface import HuggingFaceEmbeddings
+import json
+import math
+import os
+import threading
+import time
+
+from utils.chunker import chunk_document
+from utils.constants import (
+    EMBED_BATCH_SIZE, EMBEDDING_CACHE_FOLDER, AUTO_INDEX_TYPE, FLAT_INDEX_TYPE, HNSW_INDEX_TYPE, IVFPQ_INDEX_TYPE,
+    FAISS_INDEX_TYPE, FAISS_HNSW_MIN_VECTORS, FAISS_IVFPQ_MIN_VECTORS, SCALAR_QUANTIZATIONS, FAISS_SCALAR_QUANTIZATION,
+    FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH, FAISS_IVF_NPROBE, FAISS_PQ_BYTES,
+    FAISS_IVFPQ_MIN_TRAIN, FAISS_TRAIN_SAMPLE
+)
+from utils import metrics
+
+# faiss, numpy and the embedding model stack are imported where they're first needed, so importing
+# this module doesn't load them; warmup_in_background() loads them off the script thread instead
+
+INDEX_FILE = "index.faiss"
+METADATA_FILE = "index.json"
 
 class FAISSIndex:
-    def __init__(self, faiss_index, metadata):
+    def __init__(self, faiss_index, metadata, sources=None, mmapped=False):
+        # Keyed by chunk id (IndexIDMap2, or IVF-PQ's own ids), so sources can be added and removed in
+        # place. Flat while it's small, rebuilt as HNSW or IVF-PQ once it outgrows that, see choose_index_type()
         self.index = faiss_index
+        # chunk id -> chunk metadata
         self.metadata = metadata
+        # source key -> fingerprint of the version that was indexed
+        self.sources = sources or {}
+        self.mmapped = mmapped
+        self.next_id = max(metadata, default=-1) + 1
 
     def similarity_search(self, query, k=3):
-        _, I = self.index.search(query, k)
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        with metrics.span("faiss.search", k=k, vectors=self.index.ntotal):
+            _, I = self.index.search(query, k)
         results = []
         for idx in I[0]:
-            results.append(self.metadata[idx])
+            if idx >= 0:
+                results.append(self.metadata[int(idx)])
         return results
-    
+
+    def get_chunks(self):
+        return list(self.metadata.values())
+
+    def _make_writable(self):
+        # faiss aborts the process when a memory-mapped index is resized, so mutate a private copy
+        if self.mmapped:
+            import faiss
+
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self.mmapped = False
+
+    def add_documents(self, documents, batch_size=EMBED_BATCH_SIZE, fit=True):
+        """Chunk, embed and add documents as a stream, holding at most one batch of chunks at a time.
+
+        fit=False leaves the index type as it is, for callers adding several batches to call
+        fit_index_type() once at the end.
+        """
+        added = 0
+        batch = []
+        for doc in documents:
+            source = doc.get("source", doc["filename"])
+            for chunk in chunk_document(doc):
+                chunk["source"] = source
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    added += self._add_chunks(batch, batch_size)
+                    batch = []
+            self.sources[source] = doc.get("fingerprint")
+        if batch:
+            added += self._add_chunks(batch, batch_size)
+        if added and fit:
+            self.fit_index_type()
+        return added
+
+    def _add_chunks(self, chunks, batch_size):
+        import faiss
+        import numpy as np
+
+        vectors = embed_passages_cached([chunk["text"] for chunk in chunks], batch_size=batch_size)
+        ids = np.arange(self.next_id, self.next_id + len(chunks), dtype="int64")
+        if self.index is None:
+            # Chunks stream in batches; approximate indexes are built once they are all in, trained on all of them
+            self.index = build_index(FLAT_INDEX_TYPE, vectors[:0], ids[:0])
+        self._make_writable()
+        with metrics.span("faiss.add", vectors=len(chunks)):
+            self.index.add_with_ids(vectors, ids)
+        for chunk_id, chunk in zip(ids, chunks):
+            self.metadata[int(chunk_id)] = chunk
+        self.next_id += len(chunks)
+        return len(chunks)
+
+    def fit_index_type(self, on_rebuild=None):
+        """Rebuild the index as the type its size calls for, when that's not the type it has.
+
+        on_rebuild(index_type, vectors) is called before rebuilding: training IVF-PQ can take minutes.
+        """
+        if self.index is None:
+            return
+        index_type = choose_index_type(self.index.ntotal)
+        if index_type != index_type_of(self.index):
+            self._rebuild(index_type, on_rebuild)
+
+    def _rebuild(self, index_type, on_rebuild=None):
+        """Build a new index_type index of every chunk in metadata.
+
+        Vectors come from the embedding cache rather than the old index, whose SQ or PQ codes
+        only decode to approximations, so recall doesn't degrade with every rebuild.
+        """
+        import numpy as np
+
+        if on_rebuild:
+            on_rebuild(index_type, len(self.metadata))
+        ids = np.fromiter(self.metadata, dtype="int64", count=len(self.metadata))
+        vectors = embed_passages_cached([chunk["text"] for chunk in self.metadata.values()])
+        with metrics.span("faiss.rebuild", index_type=index_type, vectors=len(ids)):
+            self.index = build_index(index_type, vectors.reshape(len(ids), self.index.d), ids)
+        self.mmapped = False
+
+    def remove_source(self, source):
+        return self.remove_sources([source])
+
+    def remove_sources(self, sources, on_rebuild=None):
+        """Remove every chunk of sources in one go; returns how many were removed"""
+        sources = set(sources)
+        ids = [chunk_id for chunk_id, chunk in self.metadata.items() if chunk["source"] in sources]
+        if ids:
+            import faiss
+            import numpy as np
+
+            for chunk_id in ids:
+                del self.metadata[chunk_id]
+            # HNSW can't remove vectors, and IndexIDMap2 removes the wrong ones from IVF (as saved
+            # before IVF-PQ kept its own ids), so those are rebuilt from the rest
+            if index_type_of(self.index) == FLAT_INDEX_TYPE or not isinstance(self.index, faiss.IndexIDMap2):
+                self._make_writable()
+                self.index.remove_ids(np.array(ids, dtype="int64"))
+                self.fit_index_type(on_rebuild)
+            else:
+                self._rebuild(choose_index_type(len(self.metadata)), on_rebuild)
+        for source in sources:
+            self.sources.pop(source, None)
+        return len(ids)
+
     def get_documents(self):
-        return self.metadata
+        """Rebuild one {"filename", "text"} entry per source by stitching its chunks back together"""
+        documents = {}
+        for chunk in self.metadata.values():
+            doc = documents.setdefault(chunk["filename"], {"parts": [], "page": None, "end": 0})
+            same_page = bool(doc["parts"]) and chunk["page"] == doc["page"]
+            chunk_end = chunk["offset"] + len(chunk["text"])
+
+            if same_page and chunk["offset"] < doc["end"]:
+                doc["parts"].append(chunk["text"][doc["end"] - chunk["offset"]:])
+            elif doc["parts"]:
+                doc["parts"].append((" " if same_page else "\n") + chunk["text"])
+            else:
+                doc["parts"].append(chunk["text"])
+
+            doc["page"] = chunk["page"]
+            doc["end"] = max(doc["end"], chunk_end) if same_page else chunk_end
+        return [{"filename": filename, "text": "".join(doc["parts"])} for filename, doc in documents.items()]
+
+    def save(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        index_path = os.path.join(folder, INDEX_FILE)
+        metadata_path = os.path.join(folder, METADATA_FILE)
+
+        # Write aside and rename, so sessions that have the old file mapped keep a valid copy
+        chunks = [{"id": chunk_id, **chunk} for chunk_id, chunk in self.metadata.items()]
+        with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "model_id": embed_model_id,
+                "index_type": index_type_of(self.index) if self.index is not None else None,
+                "sources": self.sources,
+                "chunks": chunks,
+            }, f)
+        if self.index is not None:
+            import faiss
+
+            faiss.write_index(self.index, index_path + ".tmp")
+            os.replace(index_path + ".tmp", index_path)
+        elif os.path.exists(index_path):
+            os.remove(index_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+def choose_index_type(num_vectors, index_type=FAISS_INDEX_TYPE):
+    """flat, hnsw or ivfpq for an index of num_vectors chunks.
+
+    Flat searches exhaustively over float32 vectors: exact, but memory and query time grow
+    linearly. HNSW answers from a graph in roughly logarithmic time, optionally with fp16 or
+    int8 vectors. IVF-PQ searches a few clusters of FAISS_PQ_BYTES-byte codes.
+    """
+    if index_type == AUTO_INDEX_TYPE:
+        if num_vectors >= FAISS_IVFPQ_MIN_VECTORS:
+            index_type = IVFPQ_INDEX_TYPE
+        elif num_vectors >= FAISS_HNSW_MIN_VECTORS:
+            index_type = HNSW_INDEX_TYPE
+        else:
+            index_type = FLAT_INDEX_TYPE
+    if index_type == IVFPQ_INDEX_TYPE and num_vectors < FAISS_IVFPQ_MIN_TRAIN:
+        # Too few vectors to train the quantizers on, search exactly until there are enough
+        return FLAT_INDEX_TYPE
+    return index_type
+
+def index_factory_string(index_type, num_vectors, dim, scalar_quantization=FAISS_SCALAR_QUANTIZATION):
+    if index_type == HNSW_INDEX_TYPE:
+        return f"IDMap2,HNSW{FAISS_HNSW_M}{SCALAR_QUANTIZATIONS.get(scalar_quantization, '')}"
+    if index_type == IVFPQ_INDEX_TYPE:
+        # About 4 sqrt(n) clusters, with enough vectors to train each centroid
+        lists = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        code_bytes = max(m for m in range(1, FAISS_PQ_BYTES + 1) if dim % m == 0)
+        # IVF maps ids itself and, unlike IndexIDMap2 over IVF, removes them correctly
+        return f"IVF{lists},PQ{code_bytes}"
+    return "IDMap2,Flat"
+
+def build_index(index_type, vectors, ids, scalar_quantization=FAISS_SCALAR_QUANTIZATION):
+    """A new index of index_type holding vectors under ids, trained on (a sample of) them"""
+    import faiss
+    import numpy as np
+
+    index = faiss.index_factory(
+        vectors.shape[1], index_factory_string(index_type, len(vectors), vectors.shape[1], scalar_quantization)
+    )
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > FAISS_TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), FAISS_TRAIN_SAMPLE, replace=False)]
+        index.train(sample)
+    set_search_params(index)
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return index
+
+def set_search_params(index):
+    """Apply the configured recall / latency tradeoff, also to indexes saved with another one"""
+    import faiss
+
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    elif isinstance(base, faiss.IndexIVF):
+        base.nprobe = FAISS_IVF_NPROBE
+
+def index_type_of(index):
+    import faiss
+
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return HNSW_INDEX_TYPE
+    if isinstance(base, faiss.IndexIVF):
+        return IVFPQ_INDEX_TYPE
+    return FLAT_INDEX_TYPE
+
+def base_index(index):
+    """The index that stores the vectors: the one an IndexIDMap2 wraps, or IVF-PQ itself"""
+    import faiss
+
+    return faiss.downcast_index(index.index if isinstance(index, faiss.IndexIDMap2) else index)
 
 embed_model_id = 'intfloat/e5-small-v2'
 model_kwargs = {"device": "cpu", "trust_remote_code": True}
+encode_kwargs = {"batch_size": EMBED_BATCH_SIZE, "normalize_embeddings": True}
+
+# e5 models are trained with these prefixes on queries and passages
+QUERY_PREFIX = "query: "
+PASSAGE_PREFIX = "passage: "
+
+# One model per process, shared by every Streamlit session and rerun.
+_embeddings = None
+_load_lock = threading.Lock()
+# The fast HF tokenizer is not re-entrant ("Already borrowed"), so encoding is serialized.
+_encode_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "load_time": None, "calls": 0, "texts": 0, "total_time": 0.0, "last_time": None,
+    "cache_hits": 0, "cache_misses": 0
+}
+_warmup_thread = None
+_cache = None
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _load_lock:
+            if _embeddings is None:
+                start = time.perf_counter()
+                from langchain_huggingface import HuggingFaceEmbeddings
+
+                embeddings = HuggingFaceEmbeddings(
+                    model_name=embed_model_id, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
+                )
+                with _stats_lock:
+                    _stats["load_time"] = time.perf_counter() - start
+                metrics.record("embed.model_load", _stats["load_time"], model=embed_model_id)
+                _embeddings = embeddings
+    return _embeddings
+
+def get_embedding_cache():
+    global _cache
+    if _cache is None:
+        with _load_lock:
+            if _cache is None:
+                from utils.embedding_cache import EmbeddingCache
+
+                _cache = EmbeddingCache(EMBEDDING_CACHE_FOLDER, embed_model_id)
+    return _cache
+
+def _record_call(elapsed, num_texts, kind):
+    metrics.record(f"embed.{kind}", elapsed, texts=num_texts)
+    metrics.count(f"embed.{kind}_embedded", num_texts)
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["texts"] += num_texts
+        _stats["total_time"] += elapsed
+        _stats["last_time"] = elapsed
+
+def embed_query(text):
+    embeddings = get_embeddings()
+    start = time.perf_counter()
+    with _encode_lock:
+        vector = embeddings.embed_query(QUERY_PREFIX + text)
+    _record_call(time.perf_counter() - start, 1, "query")
+    return vector
+
+def embed_passages(texts, batch_size=EMBED_BATCH_SIZE):
+    import numpy as np
 
-def create_index(documents):
-    embeddings = HuggingFaceEmbeddings(model_name=embed_model_id, model_kwargs=model_kwargs)
-    texts = [doc["text"] for doc in documents]
-    metadata = [{"filename": doc["filename"], "text": doc["text"]} for doc in documents]
+    embeddings = get_embeddings()
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        batch = [PASSAGE_PREFIX + text for text in texts[i:i + batch_size]]
+        start = time.perf_counter()
+        # Lock per batch so queries from other sessions can interleave with a long ingestion
+        with _encode_lock:
+            vectors.extend(embeddings.embed_documents(batch))
+        _record_call(time.perf_counter() - start, len(batch), "passages")
+    return np.array(vectors, dtype="float32")
 
-    embeddings_matrix = [embeddings.embed_query(text) for text in texts]
-    embeddings_matrix = np.array(embeddings_matrix).astype("float32")
+def warmup():
+    # Restoring saved indexes needs faiss, load it along with the model
+    import faiss  # noqa: F401
 
-    index = faiss.IndexFlatL2(embeddings_matrix.shape[1])
-    index.add(embeddings_matrix)
+    embeddings = get_embeddings()
+    with _encode_lock:
+        embeddings.embed_query("warmup")
 
-    return FAISSIndex(index, metadata)
+def warmup_in_background():
+    global _warmup_thread
+    with _load_lock:
+        if _warmup_thread is None and _embeddings is None:
+            _warmup_thread = threading.Thread(target=warmup, name="embedder-warmup", daemon=True)
+            _warmup_thread.start()
+
+def get_embedding_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_time"] = stats["total_time"] / stats["calls"] if stats["calls"] else None
+    return stats
+
+def embed_passages_cached(texts, batch_size=EMBED_BATCH_SIZE):
+    """Look passages up in the on-disk cache and embed only the misses"""
+    import numpy as np
+
+    cache = get_embedding_cache()
+    cached = cache.get_many(texts, PASSAGE_PREFIX)
+
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+    if missing:
+        missing_vectors = embed_passages(missing, batch_size=batch_size)
+        cache.put_many(missing, PASSAGE_PREFIX, missing_vectors)
+        computed = dict(zip(missing, missing_vectors))
+        cached = [computed[text] if vector is None else vector for text, vector in zip(texts, cached)]
+
+    with _stats_lock:
+        _stats["cache_hits"] += len(texts) - len(missing)
+        _stats["cache_misses"] += len(missing)
+    metrics.count("embed.cache_hits", len(texts) - len(missing))
+    metrics.count("embed.cache_misses", len(missing))
+
+    return np.array(cached, dtype="float32")
+
+def create_index(documents, batch_size=EMBED_BATCH_SIZE):
+    faiss_index = FAISSIndex(None, {})
+    faiss_index.add_documents(documents, batch_size=batch_size)
+    return faiss_index
+
+def load_index(folder):
+    index_path = os.path.join(folder, INDEX_FILE)
+    metadata_path = os.path.join(folder, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+
+    with open(metadata_path, encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("model_id") != embed_model_id:
+        return None
+
+    metadata = {}
+    for chunk in saved["chunks"]:
+        metadata[chunk.pop("id")] = chunk
+
+    import faiss
+
+    index = None
+    mmapped = False
+    if os.path.exists(index_path):
+        # Flat vectors are mapped in place, IO_FLAG_MMAP_IFC on recent faiss builds and IO_FLAG_MMAP on older ones.
+        # Other types are read whole: IO_FLAG_MMAP would put IVF lists on disk, tied to the file
+        mmapped = saved.get("index_type", FLAT_INDEX_TYPE) == FLAT_INDEX_TYPE
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) if mmapped else 0
+        index = faiss.read_index(index_path, flags)
+        set_search_params(index)
+    if (index.ntotal if index is not None else 0) != len(metadata):
+        return None
+    return FAISSIndex(index, metadata, saved["sources"], mmapped=mmapped)
+
+def remove_saved_index(folder):
+    for name in (INDEX_FILE, METADATA_FILE):
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
 
 def retrieve_docs(query, faiss_index, k=3):
-    embeddings = HuggingFaceEmbeddings(model_name=embed_model_id, model_kwargs=model_kwargs)
-    query_embedding = np.array([embeddings.embed_query(query)]).astype("float32")
+    import numpy as np
+
+    query_embedding = np.array([embed_query(query)]).astype("float32")
     results = faiss_index.similarity_search(query_embedding, k=k)
-    return results
\ No newline at end of file
+    return results
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+SQLITE_MAX_VARIABLES = 500
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Chunk vectors keyed by (text hash, model id, prefix).
+
+    Row numbers live in SQLite, the vectors themselves in an append-only float32
+    file per model that is memory-mapped for lookups.
+    """
+
+    def __init__(self, folder, model_id):
+        os.makedirs(folder, exist_ok=True)
+        self.model_id = model_id
+        self.vectors_path = os.path.join(folder, hashlib.sha1(model_id.encode("utf-8")).hexdigest()[:16] + ".f32")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._dim = None
+
+        self._conn = sqlite3.connect(
+            os.path.join(folder, "embeddings.sqlite"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "text_hash TEXT NOT NULL, model_id TEXT NOT NULL, prefix TEXT NOT NULL, row INTEGER NOT NULL, "
+            "PRIMARY KEY (text_hash, model_id, prefix))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS models (model_id TEXT PRIMARY KEY, dim INTEGER NOT NULL)")
+
+    def _load_dim(self):
+        if self._dim is None:
+            row = self._conn.execute("SELECT dim FROM models WHERE model_id = ?", (self.model_id,)).fetchone()
+            self._dim = row[0] if row else None
+        return self._dim
+
+    def _open_vectors(self, min_rows):
+        if self._vectors is None or len(self._vectors) < min_rows:
+            row_bytes = self._dim * 4
+            rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+            self._vectors = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(rows, self._dim)) if rows else None
+        return self._vectors
+
+    def get_many(self, texts, prefix):
+        """Return a list with the cached vector for each text, or None for misses"""
+        hashes = [text_hash(text) for text in texts]
+        rows = {}
+        with self._lock:
+            if self._load_dim() is None:
+                return [None] * len(texts)
+
+            unique = list(set(hashes))
+            for i in range(0, len(unique), SQLITE_MAX_VARIABLES):
+                batch = unique[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._conn.execute(
+                    f"SELECT text_hash, row FROM embeddings WHERE model_id = ? AND prefix = ? AND text_hash IN ({placeholders})",
+                    (self.model_id, prefix, *batch)
+                ).fetchall())
+
+            vectors = self._open_vectors(max(rows.values()) + 1) if rows else None
+
+        return [np.array(vectors[rows[h]]) if h in rows else None for h in hashes]
+
+    def put_many(self, texts, prefix, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if not len(vectors):
+            return
+
+        new = {}
+        for text, vector in zip(texts, vectors):
+            new.setdefault(text_hash(text), vector)
+
+        with self._lock:
+            # BEGIN IMMEDIATE serializes writers across processes sharing RAG_files
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._load_dim() is None:
+                    self._dim = vectors.shape[1]
+                    self._conn.execute("INSERT OR IGNORE INTO models VALUES (?, ?)", (self.model_id, self._dim))
+                elif vectors.shape[1] != self._dim:
+                    raise ValueError(f"Expected {self._dim}-dimensional vectors for {self.model_id}, got {vectors.shape[1]}")
+
+                row_bytes = self._dim * 4
+                with open(self.vectors_path, "ab") as f:
+                    # Drop a partial row left behind by an interrupted write
+                    start_row = f.tell() // row_bytes
+                    f.truncate(start_row * row_bytes)
+                    f.seek(start_row * row_bytes)
+                    f.write(np.stack(list(new.values())).tobytes())
+
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                    [(h, self.model_id, prefix, start_row + i) for i, h in enumerate(new)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
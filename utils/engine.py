@@ -0,0 +1,403 @@
+"""The discussion engine, without any UI: prompt packing, generation and the discussion loop.
+
+streamlit_app drives it with callbacks that paint the page, discuss_cli with callbacks that
+write transcripts.
+"""
+import asyncio
+import os
+import queue
+import time
+
+from utils.constants import (
+    SEQUENTIAL_ROUND_MODE, SIMULTANEOUS_ROUND_MODE, MAX_CONCURRENT_RESPONSES, STREAM_REFRESH_INTERVAL, FULL_MEMORY_MODE,
+    ROLLING_MEMORY_MODE, MEMORY_RECENT_TURNS, STANDARD_PROMPT_LAYOUT, PREFIX_STABLE_PROMPT_LAYOUT, RESPONSE_CACHE_MODE
+)
+from utils.context_packer import discussion_turns, pack_context
+from utils.entity_runtime import get_entity_runtime, get_retrieved_chunks
+from utils.hedging import get_latency_tracker, run_hedged
+from utils.memory import DiscussionMemory
+from utils.response_cache import get_response_cache, response_key, sampling_params
+from utils.scheduler import get_scheduler
+from utils.tokens import count_tokens
+from utils import async_runner, metrics
+
+DEFAULT_SETTINGS = {
+    "round_mode": SEQUENTIAL_ROUND_MODE,
+    "memory_mode": FULL_MEMORY_MODE,
+    "memory_recent_turns": MEMORY_RECENT_TURNS,
+    "prompt_layout": STANDARD_PROMPT_LAYOUT,
+    "response_cache_mode": RESPONSE_CACHE_MODE,
+}
+
+class Discussion:
+    """A discussion of topic among entities, over as many cycles as run() is asked for.
+
+    The optional callbacks are all called on the thread running the discussion:
+    on_cycle_start(cycle), on_response_start(idx, entity, runtime), on_token(idx, text so far),
+    on_response(idx, response) and on_cycle_end(cycle, responses). runtimes caches entity
+    runtimes across discussions; a discussion's runtimes shouldn't be shared with another
+    one running at the same time.
+    """
+
+    def __init__(self, topic, entities, entity_materials, settings=None, runtimes=None, **callbacks):
+        self.topic = topic
+        self.entities = list(entities)
+        self.entity_materials = entity_materials
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.runtimes = {} if runtimes is None else runtimes
+        self.callbacks = callbacks
+        self.memory = None
+        if self.settings["memory_mode"] == ROLLING_MEMORY_MODE:
+            self.memory = DiscussionMemory(self.settings["memory_recent_turns"])
+        self.response_cache = get_response_cache(self.settings["response_cache_mode"])
+        self.cycles = []
+
+    def _emit(self, name, *args):
+        callback = self.callbacks.get(name)
+        if callback:
+            callback(*args)
+
+    def _token_callback(self, idx):
+        if not self.callbacks.get("on_token"):
+            return None
+        return lambda text: self.callbacks["on_token"](idx, text)
+
+    def get_runtime(self, entity):
+        return get_entity_runtime(self.runtimes, entity, self.entity_materials, self.settings["prompt_layout"])
+
+    def run(self, num_cycles):
+        """Run num_cycles more cycles; returns every cycle's responses so far"""
+        for _ in range(num_cycles):
+            cycle = len(self.cycles) + 1
+            self._emit("on_cycle_start", cycle)
+            if self.settings["round_mode"] == SIMULTANEOUS_ROUND_MODE:
+                entity_responses = self.run_simultaneous_cycle(cycle)
+            else:
+                entity_responses = self.run_sequential_cycle(cycle)
+            self.cycles.append(entity_responses)
+            self._emit("on_cycle_end", cycle, entity_responses)
+        return self.cycles
+
+    def run_sequential_cycle(self, cycle):
+        """Entities answer one after another, each seeing the answers before it"""
+        entity_responses = []
+        for idx, entity in enumerate(self.entities):
+            runtime = self.get_runtime(entity)
+            self._emit("on_response_start", idx, entity, runtime)
+
+            previous_responses = [{"entity": resp["entity"], "content": resp["content"]} for resp in entity_responses]
+            response, timings = get_entity_response(
+                runtime,
+                self.topic,
+                previous_responses=previous_responses,
+                cycle_num=cycle,
+                all_previous_cycles=self.cycles or None,
+                memory=self.memory,
+                on_token=self._token_callback(idx),
+                response_cache=self.response_cache
+            )
+
+            current_response = create_response_object(entity, response, cycle, timings)
+            entity_responses.append(current_response)
+            if self.memory is not None:
+                self.memory.add(current_response)
+            self._emit("on_response", idx, current_response)
+
+        return entity_responses
+
+    def run_simultaneous_cycle(self, cycle):
+        """Every entity answers the same cycle at once, seeing only the previous cycles"""
+        # Runtimes and contexts are resolved on this thread, retrieval stays off the event loop
+        runtimes = [self.get_runtime(entity) for entity in self.entities]
+        contexts = [
+            build_prompt_context(runtime, self.topic, cycle_num=cycle, all_previous_cycles=self.cycles, memory=self.memory)
+            for runtime in runtimes
+        ]
+        for idx, (entity, runtime) in enumerate(zip(self.entities, runtimes)):
+            self._emit("on_response_start", idx, entity, runtime)
+
+        updates = queue.SimpleQueue()
+        future = async_runner.submit(gather_entity_responses(
+            runtimes, contexts, self.topic, cycle,
+            on_token=(lambda idx, text: updates.put((idx, text))) if self.callbacks.get("on_token") else None,
+            response_cache=self.response_cache
+        ))
+        # The responses are generated on the shared event loop; callbacks stay on this thread
+        responses = pump_updates(future, updates, lambda idx, text: self._emit("on_token", idx, text))
+
+        entity_responses = []
+        for idx, (entity, (response, timings)) in enumerate(zip(self.entities, responses)):
+            current_response = create_response_object(entity, response, cycle, timings)
+            entity_responses.append(current_response)
+            self._emit("on_response", idx, current_response)
+
+        # Added once the cycle is done, entities don't see each other's answers within it
+        if self.memory is not None:
+            for current_response in entity_responses:
+                self.memory.add(current_response)
+
+        return entity_responses
+
+def prefix_reuse(all_cycles_responses):
+    """(prompt tokens sent, how many of them repeated a prefix of the entity's previous prompt)"""
+    responses = [resp for cycle in all_cycles_responses for resp in cycle if resp["prompt_tokens"]]
+    return sum(resp["prompt_tokens"] for resp in responses), sum(resp["reused_prefix_tokens"] for resp in responses)
+
+def get_entity_response(runtime, topic, previous_responses=None, cycle_num=1, all_previous_cycles=None, memory=None, on_token=None, response_cache=None):
+    pdf_context, previous_context = build_prompt_context(runtime, topic, previous_responses, cycle_num, all_previous_cycles, memory)
+    return generate_model_response(
+        runtime, topic, pdf_context, previous_context, cycle_num, on_token=on_token, response_cache=response_cache
+    )
+
+def build_prompt_context(runtime, topic, previous_responses=None, cycle_num=1, all_previous_cycles=None, memory=None):
+    """(pdf_context, previous_context) packed into the entity model's token budget"""
+    if memory is not None:
+        turns, summaries, recent_turns = list(memory.recent), memory.summaries(), memory.recent_turns
+    else:
+        turns, summaries, recent_turns = discussion_turns(previous_responses, all_previous_cycles, cycle_num), None, MEMORY_RECENT_TURNS
+
+    with metrics.span("prompt.retrieve", entity=runtime["entity_name"]):
+        chunks = get_retrieved_chunks(runtime, topic)
+    with metrics.span("prompt.pack", entity=runtime["entity_name"]):
+        return pack_context(
+            runtime["context_budget"],
+            runtime["entity_name"],
+            persona_name=runtime["persona_name"],
+            persona_text=runtime["persona_text"],
+            chunks=chunks,
+            turns=turns,
+            summaries=summaries,
+            recent_turns=recent_turns,
+            fill_chunks=runtime["layout"] != PREFIX_STABLE_PROMPT_LAYOUT
+        )
+
+def build_invoke_params(runtime, topic, pdf_context, previous_context, cycle_num):
+    invoke_params = {
+        "entity_name": runtime["entity_name"],
+        "topic": topic,
+        "previous_context": previous_context,
+        "cycle_num": cycle_num,
+        "pdf_context": pdf_context
+    }
+
+    if runtime["persona_name"]:
+        invoke_params["persona_name"] = runtime["persona_name"]
+
+    return invoke_params
+
+def measure_prompt(runtime, prompt):
+    """Prompt tokens, and how many of them open the same way as the entity's previous prompt"""
+    shared = os.path.commonprefix([prompt, runtime["last_prompt"]])
+    runtime["last_prompt"] = prompt
+    return count_tokens(prompt), count_tokens(shared)
+
+def lookup_cached_response(runtime, prompt, response_cache):
+    """(cache key, cached content or None)"""
+    if not response_cache:
+        return None, None
+    cache_key = response_key(runtime["model_id"], prompt, sampling_params(runtime["model"]))
+    return cache_key, response_cache.get(cache_key)
+
+def finish_timings(timings, start, content):
+    """Fill in the duration and token rate of a finished response and add it to the metrics"""
+    timings["duration"] = time.perf_counter() - start
+    metrics.record("llm.generate", timings["duration"], model=timings["answered_by"], cached=timings["cached"])
+    metrics.count("llm.responses")
+    if timings["prompt_tokens"]:
+        metrics.count("llm.prompt_tokens", timings["prompt_tokens"])
+    if timings.get("error"):
+        metrics.count("llm.errors")
+        return timings
+    if timings["cached"]:
+        metrics.count("llm.cache_hits")
+        return timings
+
+    timings["completion_tokens"] = count_tokens(content)
+    metrics.count("llm.completion_tokens", timings["completion_tokens"])
+    if timings["ttft"] is not None:
+        metrics.observe("llm.ttft_seconds", timings["ttft"])
+        streaming = timings["duration"] - timings["ttft"]
+        if streaming > 0 and timings["completion_tokens"]:
+            timings["tokens_per_second"] = timings["completion_tokens"] / streaming
+            metrics.observe("llm.tokens_per_second", timings["tokens_per_second"])
+    return timings
+
+def generate_model_response(runtime, topic, pdf_context, previous_context, cycle_num, on_token=None, response_cache=None):
+    """Stream the completion, passing the text so far to on_token; returns (content, timings).
+    A hit in response_cache is returned whole without calling the API, and a failure is
+    reported in timings["error"] along with a stand-in answer"""
+    if runtime["fallback"]:
+        # Hedging races two streams, which takes the event loop; tokens come back to the calling thread
+        updates = queue.SimpleQueue()
+        future = async_runner.submit(agenerate_model_response(
+            runtime, topic, pdf_context, previous_context, cycle_num,
+            on_token=lambda text: updates.put((None, text)), response_cache=response_cache
+        ))
+        return pump_updates(future, updates, lambda _, text: on_token(text) if on_token else None)
+
+    entity_name = runtime["entity_name"]
+    start = time.perf_counter()
+    timings = new_timings(runtime)
+    try:
+        with metrics.span("prompt.build", model=runtime["model_id"]):
+            invoke_params = build_invoke_params(runtime, topic, pdf_context, previous_context, cycle_num)
+            prompt = runtime["prompt"].format(**invoke_params)
+            timings["prompt_tokens"], timings["reused_prefix_tokens"] = measure_prompt(runtime, prompt)
+        cache_key, cached = lookup_cached_response(runtime, prompt, response_cache)
+        if cached is not None:
+            timings["ttft"] = time.perf_counter() - start
+            timings["cached"] = True
+            if on_token:
+                on_token(cached)
+            return cached, finish_timings(timings, start, cached)
+
+        def stream_response():
+            attempt_start = time.perf_counter()
+            content = ""
+            for chunk in runtime["chain"].stream(invoke_params):
+                if timings["ttft"] is None:
+                    timings["ttft"] = time.perf_counter() - start
+                    get_latency_tracker().record(runtime["model_id"], time.perf_counter() - attempt_start)
+                content += chunk.content
+                if on_token:
+                    on_token(content)
+            return content
+
+        # Only retried before the first token, a retry can't repeat text already shown
+        content = get_scheduler().call(runtime["model_id"], stream_response, can_retry=lambda: timings["ttft"] is None)
+        if response_cache:
+            response_cache.put(cache_key, runtime["model_id"], content)
+    except Exception as e:
+        timings["error"] = f"Error in get_entity_response for {entity_name}: {e}"
+        content = f"I'm sorry, as {entity_name}, I'm having trouble formulating a response right now."
+    return content, finish_timings(timings, start, content)
+
+async def agenerate_model_response(runtime, topic, pdf_context, previous_context, cycle_num, on_token=None, response_cache=None):
+    entity_name = runtime["entity_name"]
+    start = time.perf_counter()
+    timings = new_timings(runtime)
+    try:
+        with metrics.span("prompt.build", model=runtime["model_id"]):
+            invoke_params = build_invoke_params(runtime, topic, pdf_context, previous_context, cycle_num)
+            prompt = runtime["prompt"].format(**invoke_params)
+            timings["prompt_tokens"], timings["reused_prefix_tokens"] = measure_prompt(runtime, prompt)
+        cache_key, cached = lookup_cached_response(runtime, prompt, response_cache)
+        if cached is not None:
+            timings["ttft"] = time.perf_counter() - start
+            timings["cached"] = True
+            if on_token:
+                on_token(cached)
+            return cached, finish_timings(timings, start, cached)
+
+        content = await astream_answer(runtime, invoke_params, timings, start, on_token)
+        if response_cache:
+            # Keyed by the request as sent to the entity's model, whichever model answered it
+            response_cache.put(cache_key, runtime["model_id"], content)
+    except Exception as e:
+        timings["error"] = f"Error in get_entity_response for {entity_name}: {e}"
+        content = f"I'm sorry, as {entity_name}, I'm having trouble formulating a response right now."
+    return content, finish_timings(timings, start, content)
+
+async def astream_answer(runtime, invoke_params, timings, start, on_token=None):
+    """Stream the entity model's answer; with a fallback model, hedge it once the first token is late"""
+    state = {"winner": None}
+    first_token = asyncio.Event()
+
+    def attempt(role, model_id, chain):
+        async def stream_response():
+            attempt_start = time.perf_counter()
+            content = None
+            try:
+                async for chunk in chain.astream(invoke_params):
+                    if content is None:
+                        get_latency_tracker().record(model_id, time.perf_counter() - attempt_start)
+                        content = ""
+                    if state["winner"] is None:
+                        state["winner"] = role
+                        timings["ttft"] = time.perf_counter() - start
+                        first_token.set()
+                    if state["winner"] != role:
+                        return content
+                    content += chunk.content
+                    if on_token:
+                        on_token(content)
+            except asyncio.CancelledError:
+                if content is None:
+                    # Lost the race before its first token, which took at least this long. Leaving it out
+                    # would keep only the fast samples and make hedging ever more eager
+                    get_latency_tracker().record(model_id, time.perf_counter() - attempt_start)
+                raise
+            return content or ""
+
+        # Neither attempt retries once some answer has started streaming
+        return lambda: get_scheduler().acall(model_id, stream_response, can_retry=lambda: state["winner"] is None)
+
+    primary = attempt("primary", runtime["model_id"], runtime["chain"])
+    fallback = runtime["fallback"]
+    if not fallback:
+        return await primary()
+
+    content, winner, hedged = await run_hedged(
+        primary,
+        attempt("fallback", fallback["model_id"], fallback["chain"]),
+        get_latency_tracker().hedge_delay(runtime["model_id"]),
+        first_token,
+        lambda: state["winner"]
+    )
+    timings["hedged"] = hedged
+    if winner == "fallback":
+        timings["answered_by"] = fallback["model_id"]
+    return content
+
+def new_timings(runtime):
+    return {
+        "ttft": None, "duration": None, "prompt_tokens": None, "reused_prefix_tokens": None, "cached": False,
+        "answered_by": runtime["model_id"], "hedged": False
+    }
+
+def pump_updates(future, updates, apply):
+    """Wait for a future from the event loop, applying its (key, text) updates on this thread as they come"""
+    while True:
+        latest = {}
+        while not updates.empty():
+            key, text = updates.get()
+            latest[key] = text
+        for key, text in latest.items():
+            apply(key, text)
+        if future.done():
+            return future.result()
+        time.sleep(STREAM_REFRESH_INTERVAL)
+
+async def gather_entity_responses(runtimes, contexts, topic, cycle, on_token=None, response_cache=None, max_concurrency=MAX_CONCURRENT_RESPONSES):
+    """contexts holds each entity's (pdf_context, previous_context); on_token is called with (entity index, text so far)"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def respond(idx, runtime, context):
+        async with semaphore:
+            return await agenerate_model_response(
+                runtime, topic, *context, cycle,
+                on_token=(lambda text: on_token(idx, text)) if on_token else None,
+                response_cache=response_cache
+            )
+
+    return await asyncio.gather(*(respond(idx, runtime, context) for idx, (runtime, context) in enumerate(zip(runtimes, contexts))))
+
+def create_response_object(entity, response, cycle, timings=None):
+    timings = timings or {}
+    return {
+        "entity": entity["title"],
+        "entity_uuid": entity["uuid"],
+        "content": response,
+        "role": "assistant",
+        "cycle": cycle,
+        "ttft": timings.get("ttft"),
+        "duration": timings.get("duration"),
+        "prompt_tokens": timings.get("prompt_tokens"),
+        "completion_tokens": timings.get("completion_tokens"),
+        "tokens_per_second": timings.get("tokens_per_second"),
+        "reused_prefix_tokens": timings.get("reused_prefix_tokens"),
+        "cached": timings.get("cached", False),
+        "answered_by": timings.get("answered_by"),
+        "hedged": timings.get("hedged", False),
+        "error": timings.get("error")
+    }
@@ -0,0 +1,92 @@
+
+from chat_openrouter import get_chat_model
+from utils.constants import DEFAULT_MODEL_NAME, WIKI_LINK, RETRIEVAL_K, STANDARD_PROMPT_LAYOUT
+from utils.docloader import extract_persona_name_from_wiki_url
+from utils.embedder import retrieve_docs
+from utils.models import get_model_id, get_context_budget, get_fallback_model_name
+from utils.prompts import select_prompt
+
+def get_model(model_name):
+    # Retries are left to the request scheduler
+    return get_chat_model(get_model_id(model_name), max_retries=0)
+
+def get_entity_model(entity):
+    return get_model(entity.get("model", DEFAULT_MODEL_NAME))
+
+def get_persona_info(entity):
+    persona_mode = entity.get("persona_mode", False)
+    persona_name = None
+
+    if persona_mode:
+        wiki_url = None
+        for src in entity.get("sources", []):
+            if src["type"] == "wiki" and WIKI_LINK in src["filepath"]:
+                wiki_url = src["filepath"]
+                break
+
+        if wiki_url:
+            persona_name = extract_persona_name_from_wiki_url(wiki_url)
+
+    return persona_mode, persona_name
+
+def get_persona_text(entity_uuid, entity_materials):
+    faiss_index = entity_materials.get(entity_uuid)
+    if not faiss_index:
+        return ""
+    wiki_docs = [doc for doc in faiss_index.get_documents() if "Wiki_" in doc["filename"]]
+    return wiki_docs[0]["text"] if wiki_docs else ""
+
+def build_entity_runtime(entity, entity_materials, layout=STANDARD_PROMPT_LAYOUT):
+    """Everything about an entity's turn that doesn't change between turns"""
+    persona_mode, persona_name = get_persona_info(entity)
+    prompt = select_prompt(persona_mode, persona_name, layout)
+    model_name = entity.get("model", DEFAULT_MODEL_NAME)
+    model = get_model(model_name)
+
+    fallback = None
+    fallback_name = get_fallback_model_name(model_name) if entity.get("hedging") else None
+    if fallback_name:
+        fallback_model = get_model(fallback_name)
+        fallback = {"model_id": get_model_id(fallback_name), "chain": prompt | fallback_model}
+
+    return {
+        "entity_name": entity["title"],
+        "persona_name": persona_name,
+        "persona_text": get_persona_text(entity["uuid"], entity_materials) if persona_name else "",
+        "layout": layout,
+        "prompt": prompt,
+        "model_id": get_model_id(model_name),
+        "model": model,
+        "chain": prompt | model,
+        # Same-family model raced against the primary when it's slow, if hedging is on
+        "fallback": fallback,
+        "faiss_index": entity_materials.get(entity["uuid"]),
+        "context_budget": get_context_budget(model_name),
+        "retrieved": {},
+        # The previous rendered prompt, to measure how much of the next one is a shared prefix
+        "last_prompt": "",
+    }
+
+def get_retrieved_chunks(runtime, topic):
+    """The entity's chunks ranked against the topic, looked up once per topic"""
+    if topic not in runtime["retrieved"]:
+        chunks = []
+        if runtime["faiss_index"]:
+            chunks = retrieve_docs(topic, runtime["faiss_index"], k=RETRIEVAL_K)
+        if runtime["persona_text"]:
+            # The persona article is already in the prompt on its own
+            chunks = [chunk for chunk in chunks if "Wiki_" not in chunk["filename"]]
+        runtime["retrieved"][topic] = chunks
+    return runtime["retrieved"][topic]
+
+def get_entity_runtime(runtimes, entity, entity_materials, layout=STANDARD_PROMPT_LAYOUT):
+    """The entity's runtime from the runtimes cache, built on first use or after a layout change"""
+    runtime = runtimes.get(entity["uuid"])
+    if runtime is None or runtime["layout"] != layout:
+        runtime = build_entity_runtime(entity, entity_materials, layout)
+        runtimes[entity["uuid"]] = runtime
+    return runtime
+
+def invalidate_entity_runtime(runtimes, entity_uuid):
+    """Drop the cached runtime after the entity or its materials change"""
+    runtimes.pop(entity_uuid, None)
@@ -0,0 +1,60 @@
+import json
+import os
+import uuid
+
+from utils.constants import UPLOAD_FOLDER
+
+ENTITY_FILE = "entity.json"
+
+def get_entity_folder(entity_uuid):
+    return os.path.join(UPLOAD_FOLDER, str(entity_uuid))
+
+def save_entity_config(entity):
+    folder = get_entity_folder(entity["uuid"])
+    os.makedirs(folder, exist_ok=True)
+
+    config = {
+        "uuid": str(entity["uuid"]),
+        "title": entity["title"],
+        "model": entity.get("model"),
+        "persona_mode": entity.get("persona_mode", False),
+        "hedging": entity.get("hedging", False),
+        "sources": [
+            {key: value for key, value in src.items() if not key.startswith("_") and key != "was_loaded"}
+            for src in entity.get("sources", [])
+        ]
+    }
+    path = os.path.join(folder, ENTITY_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    os.replace(path + ".tmp", path)
+
+def load_saved_entities():
+    if not os.path.isdir(UPLOAD_FOLDER):
+        return []
+
+    entities = []
+    for name in os.listdir(UPLOAD_FOLDER):
+        path = os.path.join(UPLOAD_FOLDER, name, ENTITY_FILE)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                entity = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if entity.get("model") is None:
+            entity.pop("model", None)
+        for src in entity.get("sources", []):
+            src["was_loaded"] = False
+        entities.append(entity)
+
+    # uuid1 embeds the creation time, which keeps the original entity order
+    entities.sort(key=lambda entity: uuid.UUID(entity["uuid"]).time)
+    return entities
+
+def remove_entity_config(entity_uuid):
+    try:
+        os.remove(os.path.join(get_entity_folder(entity_uuid), ENTITY_FILE))
+    except FileNotFoundError:
+        pass
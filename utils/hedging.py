@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from collections import deque
+
+from utils.constants import HEDGE_PERCENTILE, HEDGE_WINDOW, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY
+
+class LatencyTracker:
+    """Recent first-token latencies per model, to decide when a request counts as slow"""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id, seconds):
+        with self._lock:
+            self._samples.setdefault(model_id, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, model_id, percentile=HEDGE_PERCENTILE):
+        with self._lock:
+            samples = sorted(self._samples.get(model_id, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(samples[min(int(len(samples) * percentile), len(samples) - 1)], HEDGE_MIN_DELAY)
+
+_tracker = LatencyTracker()
+
+def get_latency_tracker():
+    return _tracker
+
+async def _cancel(task):
+    if not task.done():
+        task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+async def run_hedged(primary, fallback, delay, first_token, get_winner):
+    """Run primary(), and fallback() too if no first token arrived within delay seconds.
+
+    Both attempts set first_token when their first token arrives, and get_winner() names
+    whichever did so first ("primary" or "fallback"); the other is cancelled. Returns
+    (result, role of the attempt that answered, whether the fallback was started).
+    """
+    primary_task = asyncio.ensure_future(primary())
+    first_token_task = asyncio.ensure_future(first_token.wait())
+    fallback_task = None
+    try:
+        await asyncio.wait({primary_task, first_token_task}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        if first_token.is_set() or primary_task.done():
+            return await primary_task, "primary", False
+
+        fallback_task = asyncio.ensure_future(fallback())
+        tasks = {"primary": primary_task, "fallback": fallback_task}
+        while not first_token.is_set():
+            pending = {task for task in (first_token_task, primary_task, fallback_task) if not task.done()}
+            if pending == {first_token_task}:
+                break
+            await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+        winner = get_winner()
+        if winner is None:
+            # Neither streamed anything: take one that finished cleanly, or report the primary's error
+            winner = next((role for role, task in tasks.items() if not task.exception()), "primary")
+        for role, task in tasks.items():
+            if role != winner:
+                await _cancel(task)
+        return await tasks[winner], winner, True
+    finally:
+        await _cancel(first_token_task)
+        for task in (primary_task, fallback_task):
+            if task is not None and not task.done():
+                await _cancel(task)
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.constants import HTTP_CACHE_FOLDER, HTTP_CACHE_TTL, HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_TIMEOUT
+
+USER_AGENT = 'DiscussionBot Wiki Fetcher/1.0'
+
+def create_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES):
+    """requests session with keep-alive pooling and bounded, backed-off retries"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+class HttpCache:
+    """On-disk cache of GET responses, revalidated with ETag / Last-Modified.
+
+    Entries younger than ttl seconds are served without a request; older ones are
+    revalidated with a conditional GET, so an unchanged page costs a single 304.
+    """
+
+    def __init__(self, folder, session=None, ttl=HTTP_CACHE_TTL, timeout=HTTP_TIMEOUT):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.session = session or create_session()
+        self.ttl = ttl
+        self.timeout = timeout
+        self.stats = {"fresh": 0, "revalidated": 0, "fetched": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(folder, "responses.sqlite"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL)"
+        )
+
+    def _body_path(self, url):
+        return os.path.join(self.folder, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".body")
+
+    def _lookup(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row and os.path.exists(self._body_path(url)):
+            return {"etag": row[0], "last_modified": row[1], "fetched_at": row[2]}
+        return None
+
+    def _read_body(self, url):
+        with open(self._body_path(url), encoding="utf-8") as f:
+            return f.read()
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def get(self, url):
+        entry = self._lookup(url)
+        if entry and time.time() - entry["fetched_at"] < self.ttl:
+            self._count("fresh")
+            return self._read_body(url)
+
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+
+        if response.status_code == 304 and entry:
+            with self._lock:
+                self._conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._count("revalidated")
+            return self._read_body(url)
+
+        response.raise_for_status()
+        text = response.text
+
+        path = self._body_path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (url, response.headers.get("ETag"), response.headers.get("Last-Modified"), time.time())
+            )
+        self._count("fetched")
+        return text
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_http_cache():
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = HttpCache(HTTP_CACHE_FOLDER)
+    return _default_cache
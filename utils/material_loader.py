@@ -1,15 +1,142 @@
+import logging
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse
 
-import streamlit as st
-
+import utils.blob_store as blob_store
 import utils.docloader as docloader
 import utils.embedder as embedder
+from utils.constants import MAX_PARSE_WORKERS, MAX_FETCH_WORKERS, PDF_MAX_PAGES
+from utils.entity_store import get_entity_folder
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+def report_error(message, on_error=None):
+    """Hand a loading error to on_error, or log it when nobody is listening"""
+    if on_error:
+        on_error(message)
+    else:
+        logger.error(message)
+
+def source_key(src):
+    return src["filename"] if src["type"] == "pdf" else src["filepath"]
+
+def pdf_limits(src):
+    page_range = tuple(src["page_range"]) if src.get("page_range") else None
+    return page_range, src.get("max_pages") or PDF_MAX_PAGES
+
+def document_filetype(src):
+    """The uploaded file's extension, e.g. "txt": blobs are all stored as .pdf, PyMuPDF needs telling"""
+    extension = os.path.splitext(src.get("filename") or src["filepath"])[1]
+    return extension.lstrip(".").lower() or None
+
+def pdf_fingerprint(src):
+    if src.get("sha256"):
+        sha256 = src["sha256"]
+    elif os.path.exists(src["filepath"]):
+        sha256 = blob_store.file_sha256(src["filepath"])
+    else:
+        return None
+    # Changing the page limits changes what gets indexed
+    page_range, max_pages = pdf_limits(src)
+    if page_range or src.get("max_pages"):
+        return f"{sha256}:{page_range}:{max_pages}"
+    return sha256
+
+def restore_entity_index(entity, entity_materials, processed_files):
+    entity_uuid = entity["uuid"]
+    try:
+        faiss_index = embedder.load_index(get_entity_folder(entity_uuid))
+    except Exception:
+        return False
+    if faiss_index is None:
+        return False
+
+    # Sources whose fingerprint still matches are skipped, the rest get replaced.
+    # Wiki pages are always revalidated through the HTTP cache and compared by content.
+    current = {source_key(src): src for src in entity.get("sources", [])}
+    entity_materials[entity_uuid] = faiss_index
+    processed_files[entity_uuid] = {
+        key: fingerprint for key, fingerprint in faiss_index.sources.items()
+        if key in current and (current[key]["type"] == "wiki" or pdf_fingerprint(current[key]) == fingerprint)
+    }
+    return True
+
+def needs_loading(src, entity_processed):
+    if src["type"] == "pdf":
+        return entity_processed.get(src["filename"]) != pdf_fingerprint(src)
+    return True
 
+def is_prefetchable(src):
+    return src["type"] == "wiki" or bool(src.get("sha256"))
 
+def fetch_key(src):
+    if src["type"] == "pdf":
+        return ("pdf", src.get("sha256") or src["filepath"], *pdf_limits(src))
+    return ("wiki", src["filepath"])
 
-def load_entity_materials(entity, entity_materials, processed_files):
+def parse_blob_in_worker(sha256, page_range=None, max_pages=None, filetype=None):
+    """blob_store.parse_blob for a worker process; returns the metrics it recorded, for the parent to merge"""
+    blob_store.parse_blob(sha256, page_range, max_pages, filetype)
+    return metrics.get_metrics().drain()
+
+def fetch_sources(sources, on_fetched=None):
+    """Parse PDFs in worker processes and fetch Wiki pages in threads, each distinct source once.
+
+    PDFs are parsed into the blob page cache, so only Wiki text is held in memory. Returns
+    fetch_key -> Wiki text, None for a parsed PDF, or the exception raised while loading.
+    PDFs without a blob are streamed straight from disk during indexing instead.
+    """
+    pending = {}
+    for src in sources:
+        if is_prefetchable(src):
+            pending.setdefault(fetch_key(src), src)
+
+    pdf_blobs = [key for key in pending if key[0] == "pdf"]
+    # Spawning processes costs more than parsing a single file
+    use_processes = len(pdf_blobs) > 1
+    results = {}
+
+    with metrics.span("materials.fetch", sources=len(pending)), ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as threads:
+        processes = None
+        if use_processes:
+            processes = ProcessPoolExecutor(
+                max_workers=min(MAX_PARSE_WORKERS, len(pdf_blobs)), mp_context=multiprocessing.get_context("spawn")
+            )
+        try:
+            futures = {}
+            for key, src in pending.items():
+                if key in pdf_blobs and processes:
+                    futures[processes.submit(parse_blob_in_worker, src["sha256"], *pdf_limits(src), document_filetype(src))] = key
+                elif key in pdf_blobs:
+                    futures[threads.submit(blob_store.parse_blob, src["sha256"], *pdf_limits(src), document_filetype(src))] = key
+                else:
+                    futures[threads.submit(docloader.fetch_wiki_content, src["filepath"])] = key
+
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    result = future.result()
+                    if key[0] == "pdf" and processes:
+                        metrics.get_metrics().merge(result)
+                    results[key] = None if key[0] == "pdf" else result
+                except Exception as e:
+                    results[key] = e
+                if on_fetched:
+                    on_fetched(pending[key])
+        finally:
+            if processes:
+                processes.shutdown()
+
+    return results
+
+def load_entity_materials(entity, entity_materials, processed_files, prefetched=None, on_error=None, on_status=None):
     entity_uuid = entity["uuid"]
+    if entity_uuid not in entity_materials:
+        restore_entity_index(entity, entity_materials, processed_files)
+
     docs_to_index = []
     entity_processed = processed_files.get(entity_uuid, {})
     
@@ -17,94 +144,157 @@ def load_entity_materials(entity, entity_materials, processed_files):
         src["was_loaded"] = False
         
         if src["type"] == "pdf":
-            doc_info, was_loaded, processed_entry = load_pdf_source(src, entity_processed)
+            doc_info, was_loaded, processed_entry = load_pdf_source(src, entity_processed, prefetched, on_error)
             src["was_loaded"] = was_loaded
             
             if doc_info and was_loaded and processed_entry:
-                docs_to_index.append(doc_info)
-                entity_processed[src["filename"]] = processed_entry
+                doc_info.update(source=src["filename"], fingerprint=processed_entry)
+                docs_to_index.append((src, doc_info))
                 
         elif src["type"] == "wiki":
-            doc_info, was_loaded, processed_entry = load_wiki_source(src, entity_processed)
+            doc_info, was_loaded, processed_entry = load_wiki_source(src, entity_processed, prefetched, on_error)
             src["was_loaded"] = was_loaded
             
             if doc_info and was_loaded and processed_entry:
-                docs_to_index.append(doc_info)
-                entity_processed[src["filepath"]] = processed_entry
+                doc_info.update(source=src["filepath"], fingerprint=processed_entry)
+                docs_to_index.append((src, doc_info))
             
     
+    current_keys = {source_key(src) for src in entity.get("sources", [])}
+    for key in [key for key in entity_processed if key not in current_keys]:
+        del entity_processed[key]
     processed_files[entity_uuid] = entity_processed
     
-    if docs_to_index:
-        entity_materials[entity_uuid] = embedder.create_index(docs_to_index)
-    elif entity_uuid not in entity_materials:
-        entity_materials[entity_uuid] = None
+    faiss_index = entity_materials.get(entity_uuid)
+    if faiss_index is None and docs_to_index:
+        faiss_index = embedder.FAISSIndex(None, {})
+
+    def announce_rebuild(index_type, vectors):
+        if on_status:
+            on_status(f"Rebuilding {entity['title']}'s index as {index_type} ({vectors} chunks)")
+
+    if faiss_index is not None:
+        with metrics.span("materials.index", entity=entity["title"], documents=len(docs_to_index)):
+            # Only removed and re-loaded sources are touched, the rest of the index is kept as is
+            changed_keys = {doc["source"] for _, doc in docs_to_index}
+            stale_keys = [key for key in faiss_index.sources if key not in current_keys or key in changed_keys]
+            faiss_index.remove_sources(stale_keys, on_rebuild=announce_rebuild)
+            for src, doc in docs_to_index:
+                # PDF pages are read while indexing, so a broken file only shows up here
+                try:
+                    faiss_index.add_documents([doc], fit=False)
+                except Exception as e:
+                    faiss_index.remove_source(doc["source"])
+                    entity_processed.pop(doc["source"], None)
+                    src["was_loaded"] = False
+                    report_error(f"Error indexing {doc['filename']}: {str(e)}", on_error)
+                    continue
+                entity_processed[doc["source"]] = doc["fingerprint"]
+            # Once for all the new chunks, rather than after every source
+            faiss_index.fit_index_type(on_rebuild=announce_rebuild)
+
+            if stale_keys or docs_to_index:
+                faiss_index.save(get_entity_folder(entity_uuid))
+
+    entity_materials[entity_uuid] = faiss_index
     
     return entity_materials, processed_files
 
-def load_all_entity_materials():
-    entity_materials = st.session_state.setdefault("entity_materials", {})
-    processed_files = st.session_state.setdefault("_processed_files", {})
-    total_entities = len(st.session_state.entities)
-    
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    try:
-        for idx, entity in enumerate(st.session_state.entities):
-            status_text.text(f"Processing entity: {entity['title']} ({idx+1}/{total_entities})")
-            
-            entity_materials, processed_files = load_entity_materials(
-                entity, entity_materials, processed_files
-            )
-            
-            progress = (idx + 1) / total_entities
-            progress_bar.progress(progress)
-            st.session_state.loading_progress = progress
-            
-        st.session_state.materials_loaded = True
-        st.session_state._entities_changed = False
-        
-        status_text.empty()
-        
-        st.rerun()
-    except Exception as e:
-        st.error(f"Error loading materials: {str(e)}", icon="🚨")
-        st.session_state.materials_loaded = False
+def load_materials(entities, entity_materials, processed_files, on_progress=None, on_error=None):
+    """Restore, fetch and index every entity's sources.
+
+    on_progress(label, done_steps, total_steps) is called after each step, and with the same
+    done_steps before long ones like index rebuilds; on_error(message) for each source that failed
+    to load. Returns (entity_materials, processed_files).
+    """
+    with metrics.span("materials.load", entities=len(entities)):
+        return _load_materials(entities, entity_materials, processed_files, on_progress, on_error)
 
+def _load_materials(entities, entity_materials, processed_files, on_progress, on_error):
+    for entity in entities:
+        if entity["uuid"] not in entity_materials:
+            restore_entity_index(entity, entity_materials, processed_files)
 
-def load_pdf_source(src, entity_processed):
+    pending = [
+        src for entity in entities for src in entity.get("sources", [])
+        if needs_loading(src, processed_files.get(entity["uuid"], {}))
+    ]
+    # One step per distinct source to fetch, then one per entity to index
+    total_steps = len({fetch_key(src) for src in pending if is_prefetchable(src)}) + len(entities)
+    done_steps = 0
+
+    def report(label):
+        if on_progress:
+            on_progress(label, done_steps, total_steps)
+
+    def advance(label):
+        nonlocal done_steps
+        done_steps += 1
+        report(label)
+
+    prefetched = fetch_sources(
+        pending,
+        on_fetched=lambda src: advance(f"Loaded {src.get('filename') or src['filepath']}")
+    )
+
+    # Embedding stays on this thread: one batched pass per entity over the shared model
+    for entity in entities:
+        entity_materials, processed_files = load_entity_materials(
+            entity, entity_materials, processed_files, prefetched, on_error, on_status=report
+        )
+        advance(f"Indexed entity: {entity['title']}")
+
+    return entity_materials, processed_files
+
+def _prefetched_result(src, prefetched):
+    result = prefetched.get(fetch_key(src)) if prefetched else None
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def load_pdf_source(src, entity_processed, prefetched=None, on_error=None):
     file_path = src["filepath"]
     filename = src["filename"]
-    mtime = os.path.getmtime(file_path) if os.path.exists(file_path) else None
+    fingerprint = pdf_fingerprint(src)
     
     was_loaded = False
     
-    if filename in entity_processed and entity_processed[filename] == mtime:
+    if filename in entity_processed and entity_processed[filename] == fingerprint:
         return None, True, entity_processed[filename]
     
     try:
-        text = docloader.load_pdf(file_path)
-        doc_info = {"filename": filename, "text": text}
+        _prefetched_result(src, prefetched)
+        # Pages are read lazily while indexing, so a long PDF is never held in memory at once
+        if src.get("sha256"):
+            blob_store.parse_blob(src["sha256"], *pdf_limits(src), document_filetype(src))
+            pages = blob_store.iter_pages(src["sha256"], *pdf_limits(src), document_filetype(src))
+        else:
+            pages = docloader.iter_pdf_pages(file_path, *pdf_limits(src), document_filetype(src))
+        doc_info = {"filename": filename, "pages": pages}
         
-        updated_processed_entry = mtime
+        updated_processed_entry = fingerprint
         was_loaded = True
         return doc_info, was_loaded, updated_processed_entry
     except Exception as e:
-        st.error(f"Error loading PDF {filename}: {str(e)}", icon="🚨")
+        report_error(f"Error loading PDF {filename}: {str(e)}", on_error)
         return None, False, None
 
 
-def load_wiki_source(src, entity_processed):
+def load_wiki_source(src, entity_processed, prefetched=None, on_error=None):
     url = src["filepath"]
     
     try:
-        if url in entity_processed:
-           return None, True, entity_processed[url]
-            
-        text = docloader.load_wiki_content(url)
+        if prefetched and fetch_key(src) in prefetched:
+            text = _prefetched_result(src, prefetched)
+        else:
+            text = docloader.fetch_wiki_content(url)
         
         if text:
+            # The page is re-indexed only when its text actually changed
+            fingerprint = blob_store.text_sha256(text)
+            if entity_processed.get(url) == fingerprint:
+                return None, True, fingerprint
+
             parsed_url = urlparse(url)
             path_parts = parsed_url.path.strip('/').split('/')
             page_title = path_parts[-1] if path_parts else "Wiki_Page"
@@ -119,12 +309,12 @@ def load_wiki_source(src, entity_processed):
                 "text": text
             }
             
-            updated_processed_entry = url
+            updated_processed_entry = fingerprint
             was_loaded = True
             return doc_info, was_loaded, updated_processed_entry
         else:
             return None, False, None
             
     except Exception as e:
-        st.error(f"Error loading wiki content from {url}: {str(e)}", icon="🚨")
+        report_error(f"Error loading wiki content from {url}: {str(e)}", on_error)
         return None, False, None
\ No newline at end of file
@@ -0,0 +1,51 @@
+from collections import deque
+
+from utils.chunker import SENTENCE_END
+from utils.constants import MEMORY_RECENT_TURNS, MEMORY_SUMMARY_MAX_CHARS, MEMORY_POINT_MAX_CHARS
+
+def extractive_point(turn, max_chars=MEMORY_POINT_MAX_CHARS):
+    """A response's leading sentence, which is where these short answers state their stance"""
+    content = " ".join(turn["content"].split())
+    sentence = SENTENCE_END.split(content, maxsplit=1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rsplit(" ", 1)[0] + "..."
+    return sentence
+
+class DiscussionMemory:
+    """Rolling memory of a discussion: the latest responses verbatim, older ones as per-entity summaries.
+
+    Responses are folded into their speaker's summary one at a time as they age out, so each
+    prompt stays bounded however many cycles have run. summarize turns a response into a summary
+    point and defaults to picking its leading sentence.
+    """
+
+    def __init__(self, recent_turns=MEMORY_RECENT_TURNS, max_summary_chars=MEMORY_SUMMARY_MAX_CHARS, summarize=None):
+        self.recent_turns = recent_turns
+        self.max_summary_chars = max_summary_chars
+        self.summarize = summarize or extractive_point
+        self.recent = deque()
+        # entity -> summary points, oldest first; insertion order is first-speaker order
+        self.points = {}
+        self._summaries = {}
+
+    def add(self, response):
+        self.recent.append({"entity": response["entity"], "content": response["content"], "cycle": response["cycle"]})
+        while len(self.recent) > self.recent_turns:
+            self._fold(self.recent.popleft())
+
+    def _fold(self, turn):
+        points = self.points.setdefault(turn["entity"], [])
+        points.append(self.summarize(turn))
+        # Oldest points go first once the summary outgrows its budget
+        while len(points) > 1 and sum(len(point) + 1 for point in points) > self.max_summary_chars:
+            points.pop(0)
+        self._summaries.pop(turn["entity"], None)
+
+    def summary(self, entity):
+        if entity not in self._summaries:
+            self._summaries[entity] = " ".join(self.points.get(entity, []))
+        return self._summaries[entity]
+
+    def summaries(self):
+        """entity -> summary of its responses that have aged out, in first-speaker order"""
+        return {entity: self.summary(entity) for entity in self.points}
@@ -0,0 +1,243 @@
+import contextlib
+import copy
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+from utils.constants import (
+    METRICS_MAX_SPANS, METRICS_PREFIX, OFF_METRICS_EXPORT, PROMETHEUS_METRICS_EXPORT, METRICS_EXPORT_PATH,
+    PROMETHEUS_METRICS_PATH, OTEL_METRICS_PATH
+)
+
+class Metrics:
+    """Process-wide timings and counters of the slow phases: parsing, fetching, embedding, FAISS, prompts, LLM calls.
+
+    Spans add their seconds to a per-name summary and are kept, up to max_spans, for export.
+    Counters only go up; observe() adds a value (TTFT, tokens/s) to a summary of its own.
+    """
+
+    def __init__(self, max_spans=METRICS_MAX_SPANS):
+        self._lock = threading.Lock()
+        self.max_spans = max_spans
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters = {}
+            # name -> {"count", "sum", "min", "max", "last"}, seconds for durations
+            self.durations = {}
+            self.values = {}
+            self.spans = deque(maxlen=self.max_spans)
+
+    @staticmethod
+    def _add(summaries, name, value):
+        summary = summaries.get(name)
+        if summary is None:
+            summaries[name] = {"count": 1, "sum": value, "min": value, "max": value, "last": value}
+        else:
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+            summary["last"] = value
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            self._add(self.values, name, value)
+
+    def record(self, name, seconds, end=None, **attributes):
+        """A finished span that took seconds, ending at end (a time.time(), now by default)"""
+        end = time.time() if end is None else end
+        with self._lock:
+            self._add(self.durations, name, seconds)
+            self.spans.append({"name": name, "start": end - seconds, "end": end, "attributes": attributes})
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Time the block; it can add attributes to the dict it is given"""
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record(name, time.perf_counter() - start, **attributes)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "counters": dict(self.counters),
+                "durations": copy.deepcopy(self.durations),
+                "values": copy.deepcopy(self.values),
+                "spans": list(self.spans),
+            }
+
+    def take_spans(self):
+        """The recorded spans, removing them so each is exported once"""
+        with self._lock:
+            spans = list(self.spans)
+            self.spans.clear()
+            return spans
+
+    def drain(self):
+        """snapshot() and reset(), to hand a worker process's metrics to the parent"""
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for summaries, merged in ((self.durations, snapshot["durations"]), (self.values, snapshot["values"])):
+                for name, other in merged.items():
+                    summary = summaries.setdefault(name, dict(other, count=0, sum=0))
+                    summary["count"] += other["count"]
+                    summary["sum"] += other["sum"]
+                    summary["min"] = min(summary["min"], other["min"])
+                    summary["max"] = max(summary["max"], other["max"])
+                    summary["last"] = other["last"]
+            self.spans.extend(snapshot["spans"])
+
+_metrics = Metrics()
+
+def get_metrics():
+    return _metrics
+
+def span(name, **attributes):
+    return _metrics.span(name, **attributes)
+
+def record(name, seconds, **attributes):
+    _metrics.record(name, seconds, **attributes)
+
+def count(name, amount=1):
+    _metrics.count(name, amount)
+
+def observe(name, value):
+    _metrics.observe(name, value)
+
+def rate(snapshot, counter, duration):
+    """counter per second of time spent in the duration span, or None"""
+    seconds = snapshot["durations"].get(duration, {}).get("sum")
+    return snapshot["counters"].get(counter, 0) / seconds if seconds else None
+
+def _metric_name(name, suffix=""):
+    return METRICS_PREFIX + name.replace(".", "_").replace("-", "_") + suffix
+
+def to_prometheus(snapshot):
+    """Prometheus text exposition format, e.g. for node_exporter's textfile collector"""
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = _metric_name(name, "_total")
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for summaries, suffix in ((snapshot["durations"], "_seconds"), (snapshot["values"], "")):
+        for name, summary in sorted(summaries.items()):
+            metric = _metric_name(name, suffix)
+            lines += [
+                f"# TYPE {metric} summary",
+                f"{metric}_count {summary['count']}",
+                f"{metric}_sum {summary['sum']}",
+                f"# TYPE {metric}_max gauge",
+                f"{metric}_max {summary['max']}",
+            ]
+    return "\n".join(lines) + "\n"
+
+def _otel_attributes(attributes):
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            converted.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            converted.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            converted.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            converted.append({"key": key, "value": {"stringValue": str(value)}})
+    return converted
+
+def to_otel(snapshot, service_name="discuss"):
+    """OTLP/JSON traces and metrics, as the OpenTelemetry collector's file exporter writes them"""
+    resource = {"attributes": _otel_attributes({"service.name": service_name})}
+    scope = {"name": "discuss.metrics"}
+    now = str(int(time.time() * 1e9))
+    started = str(int(snapshot["started"] * 1e9))
+
+    spans = [
+        {
+            "traceId": secrets.token_hex(16),
+            "spanId": secrets.token_hex(8),
+            "name": item["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(int(item["start"] * 1e9)),
+            "endTimeUnixNano": str(int(item["end"] * 1e9)),
+            "attributes": _otel_attributes(item["attributes"]),
+        }
+        for item in snapshot["spans"]
+    ]
+
+    metrics = [
+        {
+            "name": _metric_name(name, "_total"),
+            "sum": {
+                "aggregationTemporality": 2,
+                "isMonotonic": True,
+                "dataPoints": [{"startTimeUnixNano": started, "timeUnixNano": now, "asDouble": value}],
+            },
+        }
+        for name, value in sorted(snapshot["counters"].items())
+    ]
+    for summaries, suffix, unit in ((snapshot["durations"], "_seconds", "s"), (snapshot["values"], "", "")):
+        for name, summary in sorted(summaries.items()):
+            metrics.append({
+                "name": _metric_name(name, suffix),
+                "unit": unit,
+                "summary": {"dataPoints": [{
+                    "startTimeUnixNano": started,
+                    "timeUnixNano": now,
+                    "count": str(summary["count"]),
+                    "sum": summary["sum"],
+                    "quantileValues": [{"quantile": 0.0, "value": summary["min"]}, {"quantile": 1.0, "value": summary["max"]}],
+                }]},
+            })
+
+    return {
+        "resourceSpans": [{"resource": resource, "scopeSpans": [{"scope": scope, "spans": spans}]}],
+        "resourceMetrics": [{"resource": resource, "scopeMetrics": [{"scope": scope, "metrics": metrics}]}],
+    }
+
+def export_path(export_format):
+    if METRICS_EXPORT_PATH:
+        return METRICS_EXPORT_PATH
+    return PROMETHEUS_METRICS_PATH if export_format == PROMETHEUS_METRICS_EXPORT else OTEL_METRICS_PATH
+
+def export_metrics(export_format, path=None):
+    """Write the metrics so far to path and return it.
+
+    Prometheus text replaces the file each time. OpenTelemetry appends one OTLP/JSON line
+    with the cumulative metrics and the spans recorded since the previous export.
+    """
+    path = path or export_path(export_format)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if export_format == PROMETHEUS_METRICS_EXPORT:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(to_prometheus(_metrics.snapshot()))
+        os.replace(path + ".tmp", path)
+    else:
+        snapshot = _metrics.snapshot()
+        snapshot["spans"] = _metrics.take_spans()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(to_otel(snapshot)) + "\n")
+    return path
+
+def export_if_enabled(export_format, path=None):
+    """export_metrics() unless the format is Off; returns the path written or None"""
+    if not export_format or export_format == OFF_METRICS_EXPORT:
+        return None
+    return export_metrics(export_format, path)
@@ -1,18 +1,31 @@
+from utils.constants import PROMPT_RESERVED_TOKENS
+
+# context_window is the model's limit; context_budget caps the tokens packed into
+# a prompt's documents and discussion, to keep requests small and latency predictable
 MODEL_CONFIGS = {
-    "mistral-7b": "mistralai/mistral-7b-instruct:free",
-    "mistral-small-24b": "mistralai/mistral-small-24b-instruct-2501:free",
+    "mistral-7b": {"id": "mistralai/mistral-7b-instruct:free", "context_window": 32768, "context_budget": 3000},
+    "mistral-small-24b": {"id": "mistralai/mistral-small-24b-instruct-2501:free", "context_window": 32768, "context_budget": 6000},
     
-    "llama-3.3-8b": "meta-llama/llama-3.3-8b-instruct:free",
-    "llama-3.2-3b": "meta-llama/llama-3.2-3b-instruct:free",
+    "llama-3.3-8b": {"id": "meta-llama/llama-3.3-8b-instruct:free", "context_window": 131072, "context_budget": 4000},
+    "llama-3.2-3b": {"id": "meta-llama/llama-3.2-3b-instruct:free", "context_window": 131072, "context_budget": 3000},
     
-    "gemma-3-4b": "google/gemma-3-4b-it:free",
-    "gemma-3-12b": "google/gemma-3-12b-it:free",
+    "gemma-3-4b": {"id": "google/gemma-3-4b-it:free", "context_window": 32768, "context_budget": 3000},
+    "gemma-3-12b": {"id": "google/gemma-3-12b-it:free", "context_window": 32768, "context_budget": 4000},
 }
 
-DEFAULT_MODEL_ID = MODEL_CONFIGS["mistral-7b"]
+DEFAULT_MODEL_CONFIG = MODEL_CONFIGS["mistral-7b"]
+DEFAULT_MODEL_ID = DEFAULT_MODEL_CONFIG["id"]
+
+def get_model_config(model_name):
+    return MODEL_CONFIGS.get(model_name, DEFAULT_MODEL_CONFIG)
 
 def get_model_id(model_name):
-    return MODEL_CONFIGS.get(model_name, DEFAULT_MODEL_ID)
+    return get_model_config(model_name)["id"]
+
+def get_context_budget(model_name):
+    """Tokens available to a prompt's packed context, leaving room for the template and the answer"""
+    config = get_model_config(model_name)
+    return min(config["context_budget"], config["context_window"] - PROMPT_RESERVED_TOKENS)
 
 def list_available_models():
     return list(MODEL_CONFIGS.keys())
@@ -26,3 +39,10 @@ def get_model_family(model_name):
         return "Gemma"
     else:
         return "Unknown"
+
+def get_fallback_model_name(model_name):
+    """Another model of the same family to hedge slow requests with, or None"""
+    family = get_model_family(model_name)
+    if family == "Unknown":
+        return None
+    return next((name for name in MODEL_CONFIGS if name != model_name and get_model_family(name) == family), None)
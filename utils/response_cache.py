@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.constants import RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_BYTES, READONLY_RESPONSE_CACHE, READWRITE_RESPONSE_CACHE
+
+SAMPLING_PARAMS = ("temperature", "top_p", "max_tokens", "seed", "frequency_penalty", "presence_penalty", "stop")
+
+def sampling_params(chat_model):
+    return {name: getattr(chat_model, name, None) for name in SAMPLING_PARAMS}
+
+def response_key(model_id, prompt, params):
+    payload = json.dumps([model_id, prompt, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Completed LLM responses keyed by model id, rendered prompt and sampling params.
+
+    Entries are evicted least recently used first once their total size passes max_bytes.
+    A read-only cache serves hits but never writes, not even access times, so a recorded
+    cache can be replayed without changing it.
+    """
+
+    def __init__(self, path, max_bytes=RESPONSE_CACHE_MAX_BYTES, readonly=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.readonly = readonly
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+
+        if readonly:
+            self._conn = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, timeout=30, check_same_thread=False, isolation_level=None
+            )
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model_id TEXT NOT NULL, content TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            if not self.readonly:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key, model_id, content):
+        if self.readonly:
+            return
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, model_id, content, size, time.time())
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.stats["evicted"] += 1
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_response_cache(mode, path=RESPONSE_CACHE_PATH):
+    """The process-wide cache for mode, or None when caching is off or a read-only cache doesn't exist yet"""
+    # Unknown modes, e.g. a mistyped RESPONSE_CACHE_MODE, are off as in the sidebar
+    if mode not in (READWRITE_RESPONSE_CACHE, READONLY_RESPONSE_CACHE):
+        return None
+    readonly = mode == READONLY_RESPONSE_CACHE
+    if readonly and not os.path.exists(path):
+        return None
+    with _caches_lock:
+        if (path, readonly) not in _caches:
+            _caches[(path, readonly)] = ResponseCache(path, readonly=readonly)
+        return _caches[(path, readonly)]
@@ -0,0 +1,184 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+from utils.constants import (
+    LLM_REQUESTS_PER_MINUTE, LLM_BURST, LLM_MAX_IN_FLIGHT_PER_MODEL, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX
+)
+from utils import metrics
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Request rate limiter; reserve() takes a token and says how long to wait before using it"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Going into debt queues callers up behind each other, one token interval apart
+            self.tokens -= 1
+            debt_wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(debt_wait, self.paused_until - now, 0.0)
+
+    def pause(self, seconds):
+        """Hold every caller back, after the server asked us to slow down"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from Retry-After / retry-after-ms, or None"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Unparseable dates raise ValueError on Python 3.10+ and TypeError before; back off as usual
+        return None
+    return max(parsed.timestamp() - time.time(), 0.0) if parsed else None
+
+def is_retryable(error):
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+class RequestScheduler:
+    """Shared gate for LLM calls: a token bucket and an in-flight cap per model, plus retries.
+
+    Failed calls are retried while can_retry() allows it, which callers use to stop retrying
+    once a streamed answer has started. Retries wait as long as Retry-After asks, or back off
+    exponentially with full jitter; a 429 also pauses the model's bucket for everyone.
+    """
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, burst=LLM_BURST,
+                 max_in_flight=LLM_MAX_IN_FLIGHT_PER_MODEL, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX):
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._slots = {}
+        self.stats = {}
+
+    def _model(self, model_id):
+        with self._lock:
+            if model_id not in self._buckets:
+                self._buckets[model_id] = TokenBucket(self.rate, self.burst)
+                self._slots[model_id] = threading.BoundedSemaphore(self.max_in_flight)
+                self.stats[model_id] = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0, "waited": 0.0}
+            return self._buckets[model_id], self._slots[model_id], self.stats[model_id]
+
+    def _count(self, stats, name, amount=1):
+        with self._lock:
+            stats[name] += amount
+        # llm.requests, llm.retries, llm.rate_limited, llm.failed and llm.waited (seconds) across models
+        metrics.count(f"llm.{name}", amount)
+
+    def _retry_delay(self, bucket, stats, error, attempt, can_retry):
+        """Seconds to wait before the next attempt, or None to give up"""
+        if attempt >= self.max_retries or not is_retryable(error) or (can_retry and not can_retry()):
+            self._count(stats, "failed")
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        delay = min(delay, self.backoff_max)
+        if isinstance(error, openai.RateLimitError):
+            self._count(stats, "rate_limited")
+            bucket.pause(delay)
+        self._count(stats, "retries")
+        return delay
+
+    def call(self, model_id, fn, can_retry=None):
+        bucket, slots, stats = self._model(model_id)
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait:
+                self._count(stats, "waited", wait)
+                time.sleep(wait)
+            with slots:
+                self._count(stats, "requests")
+                try:
+                    return fn()
+                except Exception as e:
+                    delay = self._retry_delay(bucket, stats, e, attempt, can_retry)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, model_id, fn, can_retry=None):
+        """call() for a coroutine function, without blocking the event loop while waiting"""
+        bucket, slots, stats = self._model(model_id)
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait:
+                self._count(stats, "waited", wait)
+                await asyncio.sleep(wait)
+            # The slots are shared with threads, so poll rather than block the loop
+            while not slots.acquire(blocking=False):
+                await asyncio.sleep(0.05)
+            try:
+                self._count(stats, "requests")
+                return await fn()
+            except Exception as e:
+                delay = self._retry_delay(bucket, stats, e, attempt, can_retry)
+                if delay is None:
+                    raise
+            finally:
+                slots.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+def configure_scheduler(**limits):
+    """Replace the process-wide scheduler, e.g. to lift the rate limits against a local server"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = RequestScheduler(**limits)
+        return _scheduler
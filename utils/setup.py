@@ -3,6 +3,8 @@ import uuid
 
 import streamlit as st
 from utils.constants import WELCOME_MESSAGE,UPLOAD_FOLDER
+from utils.embedder import warmup_in_background
+from utils.entity_store import load_saved_entities
 
 def initialize_session_state():
     """Initialize all session state variables needed for the app"""
@@ -13,7 +15,7 @@ def initialize_session_state():
     if "answer" not in st.session_state:
         st.session_state.answer = ""
     if "entities" not in st.session_state:
-        st.session_state.entities = [{"uuid": uuid.uuid1(), "title": "Entity 1"}]
+        st.session_state.entities = load_saved_entities() or [{"uuid": uuid.uuid1(), "title": "Entity 1"}]
     if "materials_loaded" not in st.session_state:
         st.session_state.materials_loaded = False
     if "loading_progress" not in st.session_state:
@@ -28,3 +30,10 @@ def initialize_session_state():
         st.session_state.messages = [{"role": "assistant", "content": WELCOME_MESSAGE}]
 
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+    # Load the shared embedding model once per process, off the script thread
+    warmup_in_background()
+
+def get_entity_runtimes():
+    """This session's cache of entity runtimes, see utils.entity_runtime"""
+    return st.session_state.setdefault("_entity_runtimes", {})
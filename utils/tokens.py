@@ -0,0 +1,52 @@
+import re
+import threading
+from functools import lru_cache
+
+from utils.constants import TOKEN_ENCODING
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def get_encoding():
+    """The tiktoken encoding, loaded once; None when tiktoken or its BPE file is unavailable"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception:
+                    _encoding_failed = True
+    return _encoding
+
+def count_tokens(text):
+    """Token count of text; approximated from words and punctuation when no encoding is available"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(WORD_PATTERN.findall(text))
+
+@lru_cache(maxsize=8192)
+def count_tokens_cached(text):
+    """count_tokens for texts that recur across turns, like chunks and earlier responses"""
+    return count_tokens(text)
+
+def truncate_to_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+    for count, match in enumerate(WORD_PATTERN.finditer(text), 1):
+        if count == max_tokens:
+            return text[:match.end()]
+    return text